@@ -1,7 +1,20 @@
+import asyncio
+import json
+import tempfile
+from unittest import mock
+
+import requests
 import responses
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
-from wagtail_toolbox.wordpress.api_client import Client
+from wagtail_toolbox.wordpress.api_client import (
+    AdaptiveLimiter,
+    AsyncClient,
+    Client,
+    get_retry_delay,
+    iter_json_array,
+)
+from wagtail_toolbox.wordpress.response_cache import ResponseCache
 
 
 class TestClient(TestCase):
@@ -27,6 +40,7 @@ class TestClient(TestCase):
     @responses.activate
     def test_failed_get(self):
         """Test that the get method raises an exception if the request fails."""
+        responses.add(responses.GET, self.test_url, json=[])
         responses.add(
             responses.GET, self.test_url, body=Exception("Error fetching endpoint")
         )
@@ -99,3 +113,362 @@ class TestClient(TestCase):
                     f"{self.test_url}?page=2",
                 ],
             )
+
+    @responses.activate
+    def test_fetch_pages(self):
+        """Test that fetch_pages yields every page in page order."""
+        responses.add(
+            responses.GET,
+            self.test_url,
+            status=200,
+            headers={self.header_total_pages: "3"},
+        )
+        for page in range(1, 4):
+            responses.add(
+                responses.GET,
+                f"{self.test_url}?page={page}",
+                status=200,
+                json=[{"page": page}],
+            )
+        client = Client(self.test_url)
+        self.assertEqual(
+            list(client.fetch_pages()),
+            [
+                (f"{self.test_url}?page=1", [{"page": 1}]),
+                (f"{self.test_url}?page=2", [{"page": 2}]),
+                (f"{self.test_url}?page=3", [{"page": 3}]),
+            ],
+        )
+
+    @responses.activate
+    def test_fetch_pages_concurrently(self):
+        """Test that fetch_pages keeps page order when fetching concurrently."""
+        responses.add(
+            responses.GET,
+            self.test_url,
+            status=200,
+            headers={self.header_total_pages: "5"},
+        )
+        for page in range(1, 6):
+            responses.add(
+                responses.GET,
+                f"{self.test_url}?page={page}",
+                status=200,
+                json=[{"page": page}],
+            )
+        client = Client(self.test_url, max_workers=3)
+        self.assertEqual(
+            [json for _, json in client.fetch_pages()],
+            [[{"page": page}] for page in range(1, 6)],
+        )
+
+    @responses.activate
+    def test_iter_items(self):
+        """Test that iter_items yields every item of every page in order."""
+        responses.add(
+            responses.GET,
+            self.test_url,
+            status=200,
+            headers={self.header_total_pages: "3"},
+        )
+        for page in range(1, 4):
+            responses.add(
+                responses.GET,
+                f"{self.test_url}?page={page}",
+                status=200,
+                json=[{"id": page * 2 - 1}, {"id": page * 2}],
+            )
+        client = Client(self.test_url, prefetch=2)
+        self.assertEqual(
+            [item["id"] for item in client.iter_items()], [1, 2, 3, 4, 5, 6]
+        )
+
+    @responses.activate
+    def test_iter_items_read_ahead_is_bounded(self):
+        """Test that iter_items only fetches prefetch pages ahead."""
+        responses.add(
+            responses.GET,
+            self.test_url,
+            status=200,
+            headers={self.header_total_pages: "10"},
+        )
+        for page in range(1, 11):
+            responses.add(
+                responses.GET,
+                f"{self.test_url}?page={page}",
+                status=200,
+                json=[{"id": page}],
+            )
+        client = Client(self.test_url, max_workers=1, prefetch=2)
+        items = client.iter_items()
+        self.assertEqual(next(items), {"id": 1})
+        items.close()
+        # the first page, the page being processed and the 2 pages fetched ahead
+        self.assertLessEqual(len(responses.calls), 4)
+
+    @responses.activate
+    def test_paged_endpoints_with_params(self):
+        """Test that the params are sent with the first page and every paged endpoint."""
+        responses.add(
+            responses.GET,
+            f"{self.test_url}?per_page=100&_fields=id%2Ctitle",
+            status=200,
+            headers={self.header_total_pages: "2"},
+        )
+        client = Client(self.test_url, params={"per_page": 100, "_fields": "id,title"})
+        self.assertEqual(
+            client.paged_endpoints,
+            [
+                f"{self.test_url}?per_page=100&_fields=id%2Ctitle&page=1",
+                f"{self.test_url}?per_page=100&_fields=id%2Ctitle&page=2",
+            ],
+        )
+
+
+class TestAsyncClient(TestCase):
+    """Test the AsyncClient class."""
+
+    def setUp(self):
+        self.test_url = "https://example.com/wp-json/wp/v2/posts"
+        self.header_total_pages = "X-WP-TotalPages"
+        self.header_total_results = "X-WP-Total"
+
+    def add_paged_responses(self, total_pages):
+        responses.add(
+            responses.GET,
+            self.test_url,
+            status=200,
+            headers={
+                self.header_total_pages: str(total_pages),
+                self.header_total_results: str(total_pages * 2),
+            },
+        )
+        for page in range(1, total_pages + 1):
+            responses.add(
+                responses.GET,
+                f"{self.test_url}?page={page}",
+                status=200,
+                json=[{"id": page * 2 - 1}, {"id": page * 2}],
+            )
+
+    @responses.activate
+    def test_create(self):
+        """Test that create fetches the first page and reads the pagination headers."""
+        self.add_paged_responses(3)
+        client = asyncio.run(AsyncClient.create(self.test_url))
+        self.assertTrue(client.is_paged)
+        self.assertEqual(client.get_total_pages, 3)
+        self.assertEqual(client.get_total_results, 6)
+
+    @responses.activate
+    def test_create_not_found(self):
+        """Test that create raises if the first page can't be fetched, like Client."""
+        responses.add(responses.GET, self.test_url, status=404)
+        with self.assertRaises(requests.HTTPError):
+            asyncio.run(AsyncClient.create(self.test_url))
+
+    @responses.activate
+    def test_iter_pages(self):
+        """Test that iter_pages yields every page in page order."""
+        self.add_paged_responses(3)
+
+        async def collect():
+            client = await AsyncClient.create(self.test_url, max_workers=2)
+            return [url async for url, _ in client.iter_pages()]
+
+        self.assertEqual(
+            asyncio.run(collect()),
+            [f"{self.test_url}?page={page}" for page in range(1, 4)],
+        )
+
+    @responses.activate
+    def test_iter_items(self):
+        """Test that iter_items yields every item of every page in order."""
+        self.add_paged_responses(3)
+
+        async def collect():
+            client = await AsyncClient.create(self.test_url, max_workers=3)
+            return [item["id"] async for item in client.iter_items()]
+
+        self.assertEqual(asyncio.run(collect()), [1, 2, 3, 4, 5, 6])
+
+
+@mock.patch("wagtail_toolbox.wordpress.api_client.time.sleep")
+class TestRetries(TestCase):
+    """Test that failed requests are retried."""
+
+    def setUp(self):
+        self.test_url = "https://example.com/wp-json/wp/v2/posts"
+
+    @responses.activate
+    def test_retries_server_errors(self, sleep):
+        """Test that a 502 response is retried until it succeeds."""
+        responses.add(responses.GET, self.test_url, status=502)
+        responses.add(responses.GET, self.test_url, status=200, json=[{"foo": "bar"}])
+        client = Client(self.test_url)
+        self.assertEqual(client.get(self.test_url), [{"foo": "bar"}])
+        self.assertEqual(sleep.call_count, 1)
+
+    @responses.activate
+    def test_retries_connection_errors(self, sleep):
+        """Test that connection errors are retried until it succeeds."""
+        responses.add(
+            responses.GET, self.test_url, body=requests.ConnectionError("Reset")
+        )
+        responses.add(responses.GET, self.test_url, status=200, json=[])
+        client = Client(self.test_url)
+        self.assertEqual(client.get(self.test_url), [])
+
+    @responses.activate
+    def test_honours_retry_after(self, sleep):
+        """Test that the Retry-After header sets the delay before retrying."""
+        responses.add(
+            responses.GET, self.test_url, status=429, headers={"Retry-After": "3"}
+        )
+        responses.add(responses.GET, self.test_url, status=200, json=[])
+        Client(self.test_url)
+        sleep.assert_called_once_with(3.0)
+
+    @override_settings(WPI_MAX_RETRIES=2)
+    @responses.activate
+    def test_raises_when_retries_run_out(self, sleep):
+        """Test that the error is raised once the retries run out."""
+        responses.add(responses.GET, self.test_url, status=503)
+        with self.assertRaises(requests.HTTPError):
+            Client(self.test_url)
+        # 3 attempts for the first page
+        self.assertEqual(len(responses.calls), 3)
+
+    @responses.activate
+    def test_client_errors_are_not_retried(self, sleep):
+        """Test that a 404 response is raised without retrying."""
+        responses.add(responses.GET, self.test_url, status=404)
+        with self.assertRaises(requests.HTTPError):
+            Client(self.test_url)
+        self.assertEqual(len(responses.calls), 1)
+        sleep.assert_not_called()
+
+    @override_settings(WPI_RETRY_BACKOFF=1, WPI_RETRY_MAX_DELAY=10)
+    def test_get_retry_delay(self, sleep):
+        """Test that the delay is jittered exponential backoff up to the max delay."""
+        for attempt in range(6):
+            delay = get_retry_delay(attempt)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(10, 2**attempt))
+
+
+class TestAdaptiveLimiter(TestCase):
+    """Test the AdaptiveLimiter class."""
+
+    def test_failures_halve_the_limit(self):
+        limiter = AdaptiveLimiter(8)
+        limiter.record_failure()
+        self.assertEqual(limiter.limit, 4)
+        for _ in range(5):
+            limiter.record_failure()
+        self.assertEqual(limiter.limit, 1)
+
+    def test_successes_grow_the_limit(self):
+        limiter = AdaptiveLimiter(8)
+        limiter.limit = 2
+        for _ in range(2):
+            limiter.record_success()
+        self.assertEqual(limiter.limit, 3)
+        for _ in range(100):
+            limiter.record_success()
+        self.assertEqual(limiter.limit, 8)
+
+    def test_limits_requests_in_flight(self):
+        limiter = AdaptiveLimiter(2)
+        with limiter:
+            with limiter:
+                self.assertEqual(limiter.in_flight, 2)
+        self.assertEqual(limiter.in_flight, 0)
+
+
+class TestStreaming(TestCase):
+    """Test parsing pages item by item."""
+
+    def setUp(self):
+        self.test_url = "https://example.com/wp-json/wp/v2/posts"
+        self.items = [
+            {"id": 1, "content": {"rendered": "<p>caf\u00e9 \u2014 \U0001f600</p>"}},
+            {"id": 22, "tags": [1, 2, 3], "sticky": False, "parent": None},
+            123,
+            "a string with a ] and a ,",
+        ]
+
+    def test_iter_json_array(self):
+        """Test that the items are decoded whatever size the chunks are."""
+        data = json.dumps(self.items, ensure_ascii=False).encode("utf-8")
+        for size in [1, 2, 3, 7, 64, len(data)]:
+            chunks = [data[i:][:size] for i in range(0, len(data), size)]
+            self.assertEqual(list(iter_json_array(chunks)), self.items)
+
+    def test_iter_json_array_numbers(self):
+        """Test that numbers split across two chunks are decoded whole."""
+        data = b"[12345, 6.5e10, -3, 1E+2, 0.25]"
+        for i in range(1, len(data)):
+            self.assertEqual(
+                list(iter_json_array([data[:i], data[i:]])),
+                [12345, 6.5e10, -3, 1e2, 0.25],
+            )
+
+    def test_iter_json_array_whitespace(self):
+        """Test that whitespace between the items is allowed."""
+        data = b' [\n {"id": 1} ,\n\t{"id": 2}\n ] '
+        self.assertEqual(list(iter_json_array([data])), [{"id": 1}, {"id": 2}])
+
+    def test_iter_json_array_empty(self):
+        self.assertEqual(list(iter_json_array([b"[]"])), [])
+
+    def test_iter_json_array_truncated(self):
+        """Test that a truncated array raises an error."""
+        with self.assertRaises(json.JSONDecodeError):
+            list(iter_json_array([b'[{"id": 1}, {"id": ']))
+
+    def test_iter_json_array_not_an_array(self):
+        with self.assertRaises(json.JSONDecodeError):
+            list(iter_json_array([b'{"code": "rest_invalid"}']))
+
+    @responses.activate
+    def test_stream_pages(self):
+        """Test that a streaming client yields the items of each page in order."""
+        responses.add(
+            responses.GET,
+            self.test_url,
+            status=200,
+            headers={"X-WP-TotalPages": "2"},
+        )
+        responses.add(
+            responses.GET, f"{self.test_url}?page=1", json=[{"id": 1}, {"id": 2}]
+        )
+        responses.add(responses.GET, f"{self.test_url}?page=2", json=[{"id": 3}])
+        client = Client(self.test_url, stream=True)
+        self.assertEqual(
+            [item["id"] for item in client.iter_items()],
+            [1, 2, 3],
+        )
+
+    @responses.activate
+    def test_stream_skips_cache(self):
+        """Test that streamed pages are read from the network, not the cache."""
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResponseCache(directory=directory)
+            for _ in range(2):
+                responses.reset()
+                responses.add(
+                    responses.GET,
+                    self.test_url,
+                    status=200,
+                    headers={"X-WP-TotalPages": "1", "ETag": '"a"'},
+                )
+                responses.add(
+                    responses.GET,
+                    f"{self.test_url}?page=1",
+                    json=[{"id": 1}],
+                    headers={"ETag": '"b"'},
+                )
+                client = Client(self.test_url, stream=True, cache=cache)
+                self.assertEqual(list(client.iter_items()), [{"id": 1}])
+            self.assertEqual(cache.info()["responses"], 0)
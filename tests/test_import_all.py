@@ -0,0 +1,62 @@
+import responses
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from wagtail.models import Site
+
+from tests.test_wordpress_import import (
+    ImporterTestCase,
+    make_category,
+    make_post,
+    make_tag,
+)
+from wagtail_toolbox.wordpress.models import (
+    WordpressEndpoint,
+    WordpressHost,
+    WPCategory,
+    WPPost,
+    WPTag,
+)
+
+URL = "https://example.com/wp-json/wp/v2"
+
+
+@override_settings(WPI_MAX_RETRIES=0)
+class TestImportAll(ImporterTestCase):
+    """Test the import_all command."""
+
+    def setUp(self):
+        host = WordpressHost.objects.create(site=Site.objects.first())
+        for name, model in [
+            ("categories", "WPCategory"),
+            ("tags", "WPTag"),
+            ("posts", "WPPost"),
+        ]:
+            WordpressEndpoint.objects.create(
+                name=name, url=f"{URL}/{name}", model=model, setting=host
+            )
+
+    @responses.activate
+    def test_import_all(self):
+        """Test that every endpoint is imported and the relations resolved."""
+        self.add_pages(f"{URL}/categories", [[make_category(1)]])
+        self.add_pages(f"{URL}/tags", [[make_tag(5)]])
+        self.add_pages(f"{URL}/posts", [[make_post(1, categories=[1], tags=[5])]])
+
+        call_command("import_all", endpoints=4)
+
+        post = WPPost.objects.get(wp_id=1)
+        self.assertEqual(list(post.categories.values_list("wp_id", flat=True)), [1])
+        self.assertEqual(list(post.tags.values_list("wp_id", flat=True)), [5])
+
+    @responses.activate
+    def test_failed_endpoint(self):
+        """Test that the command fails if an endpoint isn't imported."""
+        self.add_pages(f"{URL}/categories", [[make_category(1)]])
+        responses.add(responses.GET, f"{URL}/tags", status=500)
+
+        with self.assertRaisesMessage(CommandError, "Not imported: WPPost, WPTag"):
+            call_command("import_all")
+
+        self.assertEqual(WPCategory.objects.count(), 1)
+        self.assertEqual(WPTag.objects.count(), 0)
+        self.assertEqual(WPPost.objects.count(), 0)
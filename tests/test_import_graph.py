@@ -0,0 +1,82 @@
+import threading
+
+from django.test import TestCase
+
+from wagtail_toolbox.wordpress.import_graph import (
+    FAILED,
+    SKIPPED,
+    SUCCEEDED,
+    get_model_dependencies,
+    run_in_dependency_order,
+)
+
+MODELS = ["WPAuthor", "WPCategory", "WPTag", "WPPage", "WPPost", "WPComment"]
+
+
+class TestImportGraph(TestCase):
+    """Test the dependency order of the endpoint imports."""
+
+    def test_get_model_dependencies(self):
+        """Test that references to the model itself are ignored."""
+        dependencies = get_model_dependencies(MODELS)
+        self.assertEqual(dependencies["WPAuthor"], set())
+        self.assertEqual(dependencies["WPCategory"], set())
+        self.assertEqual(dependencies["WPPage"], {"WPAuthor"})
+        self.assertEqual(dependencies["WPPost"], {"WPAuthor", "WPCategory", "WPTag"})
+        self.assertEqual(dependencies["WPComment"], {"WPAuthor", "WPPost"})
+
+    def test_get_model_dependencies_of_selected_models(self):
+        """Test that models that aren't being imported are ignored."""
+        dependencies = get_model_dependencies(["WPCategory", "WPPost"])
+        self.assertEqual(dependencies, {"WPCategory": set(), "WPPost": {"WPCategory"}})
+
+    def test_run_in_dependency_order(self):
+        """Test that each model runs after its dependencies, the others at once."""
+        dependencies = get_model_dependencies(MODELS)
+        finished = []
+        started = threading.Barrier(3, timeout=5)
+
+        def run(name):
+            if name in ["WPAuthor", "WPCategory", "WPTag"]:
+                started.wait()  # fails unless all three run at the same time
+            self.assertTrue(all(d in finished for d in dependencies[name]))
+            finished.append(name)
+
+        results = run_in_dependency_order(dependencies, run, max_workers=3)
+        self.assertEqual(results, {name: SUCCEEDED for name in MODELS})
+        self.assertEqual(finished[-1], "WPComment")
+
+    def test_dependents_of_failed_are_skipped(self):
+        dependencies = get_model_dependencies(MODELS)
+
+        def run(name):
+            if name == "WPTag":
+                raise ValueError("failed")
+
+        results = run_in_dependency_order(dependencies, run)
+        self.assertEqual(results["WPTag"], FAILED)
+        self.assertEqual(results["WPPost"], SKIPPED)
+        self.assertEqual(results["WPComment"], SKIPPED)
+        self.assertEqual(results["WPPage"], SUCCEEDED)
+
+    def test_circular_dependencies(self):
+        with self.assertRaises(ValueError):
+            run_in_dependency_order({"a": {"b"}, "b": {"a"}}, lambda name: None)
+
+    def test_run_one_at_a_time(self):
+        """Test that with one worker each name runs in the calling thread, in order."""
+        dependencies = get_model_dependencies(MODELS)
+        finished = []
+
+        def run(name):
+            self.assertIs(threading.current_thread(), threading.main_thread())
+            self.assertTrue(all(d in finished for d in dependencies[name]))
+            if name == "WPTag":
+                raise ValueError("failed")
+            finished.append(name)
+
+        results = run_in_dependency_order(dependencies, run, max_workers=1)
+        self.assertEqual(results["WPTag"], FAILED)
+        self.assertEqual(results["WPPost"], SKIPPED)
+        self.assertEqual(results["WPComment"], SKIPPED)
+        self.assertEqual(finished, ["WPAuthor", "WPCategory", "WPPage"])
@@ -0,0 +1,99 @@
+import json
+
+import responses
+from django.test import TestCase
+
+from wagtail_toolbox.wordpress.api_client import Client
+from wagtail_toolbox.wordpress.builder_utils import fetch_url
+from wagtail_toolbox.wordpress.metrics import RequestMetrics, metrics, percentile
+
+
+class TestRequestMetrics(TestCase):
+    """Test the RequestMetrics class."""
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3], 99), 3)
+        self.assertEqual(percentile([], 50), 0)
+
+    def test_summary(self):
+        """Test that the requests and items are summarised per endpoint."""
+        request_metrics = RequestMetrics()
+        for latency in [0.1, 0.2, 0.3, 0.4]:
+            request_metrics.record("posts", "posts?page=1", 200, latency, 1000)
+        request_metrics.record("posts", "posts?page=2", 503, 0.5, 0, retries=2)
+        request_metrics.record("tags", "tags?page=1", 200, 0.1, 500, decode_time=0.01)
+        request_metrics.record_items("posts", 10)
+
+        summary = request_metrics.summary()
+        self.assertEqual(summary["posts"]["requests"], 5)
+        self.assertEqual(summary["posts"]["retries"], 2)
+        self.assertEqual(summary["posts"]["status_codes"], {200: 4, 503: 1})
+        self.assertEqual(summary["posts"]["latency_p50"], 0.3)
+        self.assertEqual(summary["posts"]["latency_p99"], 0.5)
+        self.assertEqual(summary["posts"]["bytes"], 4000)
+        self.assertEqual(summary["posts"]["items"], 10)
+        self.assertGreater(summary["posts"]["items_per_second"], 0)
+        self.assertEqual(summary["tags"]["decode_time"], 0.01)
+        self.assertEqual(len(request_metrics.format_summary()), 12)
+
+    def test_reset(self):
+        request_metrics = RequestMetrics()
+        request_metrics.record("posts", "posts?page=1", 200, 0.1, 1000)
+        request_metrics.reset()
+        self.assertEqual(request_metrics.summary(), {})
+
+
+class TestClientMetrics(TestCase):
+    """Test that the client records its requests."""
+
+    def setUp(self):
+        self.test_url = "https://example.com/wp-json/wp/v2/posts"
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def add_pages(self, body):
+        responses.add(
+            responses.GET, self.test_url, body=body, headers={"X-WP-TotalPages": "1"}
+        )
+        responses.add(responses.GET, f"{self.test_url}?page=1", body=body)
+
+    @responses.activate
+    def test_client_records_requests(self):
+        body = json.dumps([{"id": 1}, {"id": 2}])
+        self.add_pages(body)
+        client = Client(self.test_url)
+        self.assertEqual(len(list(client.iter_items())), 2)
+
+        stats = metrics.summary()[self.test_url]
+        self.assertEqual(stats["requests"], 2)
+        self.assertEqual(stats["status_codes"], {200: 2})
+        self.assertEqual(stats["bytes"], len(body) * 2)
+        self.assertGreaterEqual(stats["decode_time"], 0)
+
+    @responses.activate
+    def test_streaming_client_records_requests(self):
+        body = json.dumps([{"id": 1}, {"id": 2}])
+        self.add_pages(body)
+        client = Client(self.test_url, stream=True)
+        self.assertEqual(len(list(client.iter_items())), 2)
+
+        stats = metrics.summary()[self.test_url]
+        self.assertEqual(stats["requests"], 2)
+        self.assertEqual(stats["status_codes"], {200: 2})
+
+    @responses.activate
+    def test_fetch_url_records_size_without_content_length(self):
+        """Test that media is measured by its body, e.g. when it's chunked."""
+        url = "https://example.com/wp-content/uploads/image.jpg"
+        responses.add(responses.GET, url, body=b"x" * 1000)
+        response, status, _ = fetch_url(url)
+        self.assertNotIn("content-length", response.headers)
+
+        stats = metrics.summary()["fetch_url"]
+        self.assertEqual(stats["bytes"], 1000)
@@ -0,0 +1,26 @@
+from django.test import TestCase
+
+from wagtail_toolbox.wordpress.models import WPCategory, WPPost, WPTag
+
+
+class TestWordpressModel(TestCase):
+    """Test the WordpressModel base class."""
+
+    def test_include_fields_source_request(self):
+        """Test that only the keys the import reads are requested."""
+        fields = WPPost.include_fields_source_request(WPPost)
+        self.assertEqual(fields[0], "id")
+        for field in ["title", "content", "author", "categories", "tags"]:
+            self.assertIn(field, fields)
+        for field in ["wp_id", "wp_cleaned_content", "wp_block_content", "_links"]:
+            self.assertNotIn(field, fields)
+
+    def test_include_fields_source_request_excludes_reverse_relations(self):
+        """Test that reverse relations and duplicates are not requested."""
+        fields = WPCategory.include_fields_source_request(WPCategory)
+        self.assertNotIn("wppost", fields)
+        self.assertEqual(fields.count("parent"), 1)
+
+    def test_include_fields_source_request_unique_fields(self):
+        """Test that the UNIQUE_FIELDS are requested."""
+        self.assertIn("name", WPTag.include_fields_source_request(WPTag))
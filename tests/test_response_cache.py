@@ -0,0 +1,195 @@
+import os
+import tempfile
+from unittest import mock
+
+import responses
+from django.test import TestCase
+from responses import matchers
+
+from wagtail_toolbox.wordpress.api_client import Client
+from wagtail_toolbox.wordpress.builder_utils import fetch_url
+from wagtail_toolbox.wordpress.response_cache import ResponseCache, get_media_cache
+
+
+class TestResponseCache(TestCase):
+    """Test the ResponseCache class."""
+
+    def setUp(self):
+        self.test_url = "https://example.com/wp-json/wp/v2/posts"
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(directory=self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @responses.activate
+    def test_not_modified_uses_cached_body(self):
+        """Test that a 304 response returns the cached body and headers."""
+        responses.add(
+            responses.GET,
+            self.test_url,
+            status=200,
+            json=[{"foo": "bar"}],
+            headers={"ETag": '"abc"', "X-WP-TotalPages": "1"},
+        )
+        self.cache.get(self.test_url)
+
+        responses.replace(
+            responses.GET,
+            self.test_url,
+            status=304,
+            match=[matchers.header_matcher({"If-None-Match": '"abc"'})],
+        )
+        response = self.cache.get(self.test_url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{"foo": "bar"}])
+        self.assertEqual(response.headers["X-WP-TotalPages"], "1")
+
+    @responses.activate
+    def test_missing_body_is_requested_again(self):
+        """Test that a 304 whose cached body was removed is requested whole."""
+        responses.add(
+            responses.GET,
+            self.test_url,
+            status=200,
+            json=[{"foo": "bar"}],
+            headers={"ETag": '"abc"'},
+        )
+        self.cache.get(self.test_url)
+        _, body_path = self.cache.get_paths(self.cache.get_key(self.test_url))
+        os.remove(body_path)  # as if evicted by another thread
+
+        responses.replace(
+            responses.GET,
+            self.test_url,
+            status=304,
+            match=[matchers.header_matcher({"If-None-Match": '"abc"'})],
+        )
+        responses.add(responses.GET, self.test_url, status=200, json=[{"foo": "baz"}])
+        response = self.cache.get(self.test_url)
+
+        self.assertEqual(response.json(), [{"foo": "baz"}])
+        self.assertNotIn("If-None-Match", responses.calls[-1].request.headers)
+        self.assertIsNone(self.cache.load_meta(self.cache.get_key(self.test_url)))
+
+    @responses.activate
+    def test_fetch_url_uses_media_cache(self):
+        """Test that media is cached apart from the API responses."""
+        url = "https://example.com/wp-content/uploads/image.jpg"
+        responses.add(
+            responses.GET, url, status=200, body=b"image", headers={"ETag": '"i"'}
+        )
+        with tempfile.TemporaryDirectory() as directory, self.settings(
+            WPI_CACHE_ENABLED=True, WPI_MEDIA_CACHE_DIR=directory
+        ):
+            fetch_url(url)
+            media_cache = get_media_cache()
+            self.assertEqual(media_cache.directory, directory)
+            self.assertEqual(media_cache.info()["responses"], 1)
+            self.assertIs(get_media_cache(), media_cache)
+        self.assertEqual(self.cache.info()["responses"], 0)
+
+    @responses.activate
+    def test_modified_replaces_cached_body(self):
+        """Test that a 200 response to a revalidation replaces the cached body."""
+        responses.add(
+            responses.GET,
+            self.test_url,
+            status=200,
+            json=[{"foo": "bar"}],
+            headers={"Last-Modified": "Mon, 01 May 2023 10:00:00 GMT"},
+        )
+        self.cache.get(self.test_url)
+
+        responses.replace(
+            responses.GET,
+            self.test_url,
+            status=200,
+            json=[{"foo": "baz"}],
+            headers={"Last-Modified": "Tue, 02 May 2023 10:00:00 GMT"},
+            match=[
+                matchers.header_matcher(
+                    {"If-Modified-Since": "Mon, 01 May 2023 10:00:00 GMT"}
+                )
+            ],
+        )
+        self.assertEqual(self.cache.get(self.test_url).json(), [{"foo": "baz"}])
+        self.assertEqual(self.cache.info()["responses"], 1)
+
+    @responses.activate
+    def test_responses_without_validators_are_not_cached(self):
+        """Test that a response that can't be revalidated isn't stored."""
+        responses.add(responses.GET, self.test_url, status=200, json=[])
+        self.cache.get(self.test_url)
+        self.assertEqual(self.cache.info()["responses"], 0)
+
+    @responses.activate
+    def test_evict(self):
+        """Test that the least recently used responses are evicted over max_size."""
+        cache = ResponseCache(directory=self.directory.name, max_size=10)
+        for page in range(1, 4):
+            responses.add(
+                responses.GET,
+                f"{self.test_url}?page={page}",
+                status=200,
+                body="x" * 6,
+                headers={"ETag": f'"{page}"'},
+            )
+            cache.get(f"{self.test_url}?page={page}")
+
+        self.assertEqual(cache.info()["responses"], 1)
+        self.assertIsNotNone(cache.load_meta(cache.get_key(f"{self.test_url}?page=3")))
+
+    @responses.activate
+    def test_size_is_tracked(self):
+        """Test that the directory is only scanned once and when evicting."""
+        cache = ResponseCache(directory=self.directory.name, max_size=20)
+        with mock.patch.object(
+            cache, "get_entries", wraps=cache.get_entries
+        ) as get_entries:
+            for page in range(1, 5):
+                responses.add(
+                    responses.GET,
+                    f"{self.test_url}?page={page}",
+                    status=200,
+                    body="x" * 6,
+                    headers={"ETag": f'"{page}"'},
+                )
+                cache.get(f"{self.test_url}?page={page}")
+
+        # the first scan, then one eviction when the fourth page is stored
+        self.assertEqual(get_entries.call_count, 2)
+        self.assertEqual(cache.size, 18)
+        self.assertEqual(cache.info()["size"], 18)
+
+    @responses.activate
+    def test_clear(self):
+        """Test that clear removes every cached response."""
+        responses.add(
+            responses.GET, self.test_url, status=200, json=[], headers={"ETag": '"a"'}
+        )
+        self.cache.get(self.test_url)
+        self.cache.clear()
+        self.assertEqual(self.cache.info()["responses"], 0)
+
+    @responses.activate
+    def test_client_uses_cache(self):
+        """Test that the client revalidates its requests against the cache."""
+        responses.add(
+            responses.GET,
+            f"{self.test_url}?per_page=100",
+            status=200,
+            json=[{"foo": "bar"}],
+            headers={"ETag": '"abc"', "X-WP-TotalPages": "1"},
+        )
+        Client(self.test_url, params={"per_page": 100}, cache=self.cache)
+
+        responses.replace(
+            responses.GET,
+            f"{self.test_url}?per_page=100",
+            status=304,
+            match=[matchers.header_matcher({"If-None-Match": '"abc"'})],
+        )
+        client = Client(self.test_url, params={"per_page": 100}, cache=self.cache)
+        self.assertEqual(client.get_total_pages, 1)
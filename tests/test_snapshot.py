@@ -0,0 +1,102 @@
+import gzip
+import json
+import os
+import tempfile
+
+import responses
+from django.test import TestCase
+
+from tests.test_wordpress_import import make_category
+from wagtail_toolbox.wordpress.api_client import Client
+from wagtail_toolbox.wordpress.models import WPCategory
+from wagtail_toolbox.wordpress.snapshot import (
+    SnapshotClient,
+    get_snapshot_path,
+    write_snapshot,
+)
+from wagtail_toolbox.wordpress.wordpress_import import Importer
+
+
+class TestSnapshot(TestCase):
+    """Test writing and replaying snapshots."""
+
+    url = "https://example.com/wp-json/wp/v2/categories"
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = get_snapshot_path(self.directory.name, "WPCategory")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_snapshot(self, pages):
+        with responses.RequestsMock() as mock:
+            self.add_pages(mock, self.url, pages)
+            client = Client(self.url, params={"per_page": 2})
+            return write_snapshot(client, self.path, "WPCategory")
+
+    def add_pages(self, mock, url, pages):
+        for index, items in enumerate(pages, start=1):
+            mock.add(responses.GET, f"{url}?per_page=2&page={index}", json=items)
+        mock.add(
+            responses.GET,
+            f"{url}?per_page=2",
+            json=pages[0],
+            headers={"X-WP-TotalPages": str(len(pages)), "X-WP-Total": "3"},
+        )
+
+    def test_write_snapshot(self):
+        """Test that the header and one item per line are written."""
+        count = self.write_snapshot(
+            [[make_category(1), make_category(2)], [make_category(3)]]
+        )
+        self.assertEqual(count, 3)
+
+        with gzip.open(self.path, "rt") as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(lines[0]["headers"]["X-WP-TotalPages"], "2")
+        self.assertEqual([line["id"] for line in lines[1:]], [1, 2, 3])
+        self.assertFalse(os.path.exists(f"{self.path}.tmp"))
+
+    def test_snapshot_client(self):
+        """Test that the snapshot is replayed with the same pages and headers."""
+        self.write_snapshot([[make_category(1), make_category(2)], [make_category(3)]])
+        client = SnapshotClient(self.path)
+
+        self.assertTrue(client.is_paged)
+        self.assertEqual(client.get_total_pages, 2)
+        self.assertEqual(client.get_total_results, 3)
+        self.assertEqual(
+            [
+                (url, [item["id"] for item in items])
+                for url, items in client.fetch_pages()
+            ],
+            [
+                (f"{self.url}?per_page=2&page=1", [1, 2]),
+                (f"{self.url}?per_page=2&page=2", [3]),
+            ],
+        )
+
+    def test_import_from_snapshot(self):
+        """Test that the importer can read a snapshot instead of the network."""
+        self.write_snapshot(
+            [[make_category(1), make_category(2, parent=1)], [make_category(3)]]
+        )
+
+        with responses.RequestsMock():  # any request would fail
+            Importer(
+                self.url, "WPCategory", client=SnapshotClient(self.path)
+            ).import_data()
+
+        self.assertEqual(WPCategory.objects.count(), 3)
+        self.assertEqual(WPCategory.objects.get(wp_id=2).parent.wp_id, 1)
+
+
+class TestEmptySnapshot(TestCase):
+    def test_unpaged_snapshot(self):
+        """Test that a snapshot of an endpoint without pages replays no pages."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = get_snapshot_path(directory, "WPTag")
+            with gzip.open(path, "wt") as f:
+                f.write(json.dumps({"url": "", "params": {}, "headers": {}}) + "\n")
+            self.assertEqual(list(SnapshotClient(path).fetch_pages()), [])
@@ -0,0 +1,72 @@
+import responses
+
+from tests.test_wordpress_import import ImporterTestCase, make_category
+from wagtail_toolbox.wordpress.models import ImportPayload, WPCategory
+from wagtail_toolbox.wordpress.staging import (
+    StagingClient,
+    decode_payload,
+    stage_items,
+)
+from wagtail_toolbox.wordpress.wordpress_import import Importer
+
+
+class TestStaging(ImporterTestCase):
+    """Test staging the raw json and rebuilding records from it."""
+
+    url = "https://example.com/wp-json/wp/v2/categories"
+
+    @responses.activate
+    def test_import_stages_raw_items(self):
+        items = [make_category(1), make_category(2, parent=1)]
+        self.add_pages(self.url, [items])
+        Importer(self.url, "WPCategory").import_data()
+
+        payloads = ImportPayload.objects.filter(model="WPCategory")
+        self.assertEqual(
+            [decode_payload(payload.payload) for payload in payloads],
+            [make_category(1), make_category(2, parent=1)],
+        )
+
+    def test_stage_items_replaces(self):
+        stage_items("WPCategory", [make_category(1)])
+        stage_items("WPCategory", [make_category(1, name="New"), make_category(2)])
+
+        payloads = ImportPayload.objects.filter(model="WPCategory")
+        self.assertEqual(
+            [decode_payload(payload.payload)["name"] for payload in payloads],
+            ["New", "Category 2"],
+        )
+
+    def test_fetch_pages(self):
+        """Test that the pages are read in wp_id order, from any page."""
+        stage_items("WPCategory", [make_category(wp_id) for wp_id in [5, 1, 3, 2, 4]])
+        client = StagingClient("WPCategory", per_page=2)
+
+        self.assertEqual(client.get_total_pages, 3)
+        pages = [
+            [item["id"] for item in json_response]
+            for _, json_response in client.fetch_pages()
+        ]
+        self.assertEqual(pages, [[1, 2], [3, 4], [5]])
+
+        urls = client.paged_endpoints[1:]
+        self.assertEqual([item["id"] for item in client.iter_items(urls)], [3, 4, 5])
+
+    def test_rebuild_from_staging(self):
+        """Test that the records are rebuilt without the network."""
+        stage_items(
+            "WPCategory",
+            [make_category(1), make_category(2, parent=1), make_category(3, parent=2)],
+        )
+
+        importer = Importer(
+            "",
+            "WPCategory",
+            client=StagingClient("WPCategory", per_page=2),
+            force=True,
+            stage=False,
+        )
+        importer.import_data()
+
+        self.assertEqual(WPCategory.objects.count(), 3)
+        self.assertEqual(WPCategory.objects.get(wp_id=3).parent.wp_id, 2)
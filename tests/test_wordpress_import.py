@@ -0,0 +1,788 @@
+import datetime
+import io
+from unittest import mock
+
+import responses
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from responses import matchers
+from wagtail.models import Site
+
+from wagtail_toolbox.wordpress.models import (
+    ImportCheckpoint,
+    StreamBlockSignatureBlocks,
+    WordpressEndpoint,
+    WordpressHost,
+    WPAuthor,
+    WPCategory,
+    WPMedia,
+    WPPost,
+    WPTag,
+)
+from wagtail_toolbox.wordpress.wordpress_import import Importer, get_extraction_plan
+
+
+def make_category(wp_id, parent=0, name=None):
+    return {
+        "id": wp_id,
+        "name": name or f"Category {wp_id}",
+        "count": 0,
+        "link": f"https://example.com/category/{wp_id}/",
+        "slug": f"category-{wp_id}",
+        "description": "",
+        "taxonomy": "category",
+        "parent": parent,
+    }
+
+
+def make_tag(wp_id, name=None):
+    return {
+        "id": wp_id,
+        "name": name or f"Tag {wp_id}",
+        "count": 0,
+        "link": f"https://example.com/tag/{wp_id}/",
+        "slug": f"tag-{wp_id}",
+        "description": "",
+        "taxonomy": "post_tag",
+    }
+
+
+def make_post(wp_id, author=0, categories=None, tags=None, content=""):
+    return {
+        "id": wp_id,
+        "title": {"rendered": f"Post {wp_id}"},
+        "date": "2023-01-01T10:00:00",
+        "date_gmt": "2023-01-01T10:00:00",
+        "guid": {"rendered": f"https://example.com/?p={wp_id}"},
+        "modified": "2023-01-01T10:00:00",
+        "modified_gmt": "2023-01-01T10:00:00",
+        "slug": f"post-{wp_id}",
+        "status": "publish",
+        "type": "post",
+        "link": f"https://example.com/post-{wp_id}/",
+        "content": {"rendered": content},
+        "excerpt": {"rendered": ""},
+        "comment_status": "open",
+        "ping_status": "open",
+        "sticky": False,
+        "format": "standard",
+        "template": "",
+        "author": author,
+        "categories": categories or [],
+        "tags": tags or [],
+    }
+
+
+def make_media(wp_id, modified_gmt="2023-01-01T10:00:00"):
+    return {
+        "id": wp_id,
+        "title": {"rendered": f"Media {wp_id}"},
+        "date": "2023-01-01T10:00:00",
+        "date_gmt": "2023-01-01T10:00:00",
+        "guid": {"rendered": f"https://example.com/?attachment_id={wp_id}"},
+        "modified": modified_gmt,
+        "modified_gmt": modified_gmt,
+        "slug": f"media-{wp_id}",
+        "status": "inherit",
+        "comment_status": "open",
+        "ping_status": "closed",
+        "type": "attachment",
+        "link": f"https://example.com/media-{wp_id}/",
+        "template": "",
+        "description": {"rendered": ""},
+        "caption": {"rendered": ""},
+        "alt_text": "",
+        "media_type": "image",
+        "mime_type": "image/jpeg",
+        "source_url": f"https://example.com/media-{wp_id}.jpg",
+        "author": 0,
+        "post": None,
+    }
+
+
+class ImporterTestCase(TestCase):
+    """Helpers to respond to the requests of an Importer."""
+
+    def add_pages(self, url, pages):
+        """Respond with each page of items, and the first page without a page param."""
+        for index, items in enumerate(pages, start=1):
+            responses.add(
+                responses.GET,
+                url,
+                json=items,
+                match=[
+                    matchers.query_param_matcher(
+                        {"page": str(index)}, strict_match=False
+                    )
+                ],
+            )
+        responses.add(
+            responses.GET,
+            url,
+            json=pages[0] if pages else [],
+            headers={
+                "X-WP-TotalPages": str(len(pages)),
+                "X-WP-Total": str(sum(len(items) for items in pages)),
+            },
+        )
+
+
+class TestImporter(ImporterTestCase):
+    """Test the Importer class."""
+
+    url = "https://example.com/wp-json/wp/v2/categories"
+
+    @responses.activate
+    def test_import_data(self):
+        """Test that every item is imported and self referencing keys resolved."""
+        self.add_pages(
+            self.url,
+            [
+                [make_category(1), make_category(2, parent=3)],
+                [make_category(3, parent=1)],
+            ],
+        )
+        Importer(self.url, "WPCategory").import_data()
+
+        self.assertEqual(WPCategory.objects.count(), 3)
+        self.assertEqual(WPCategory.objects.get(wp_id=2).parent.wp_id, 3)
+        self.assertEqual(WPCategory.objects.get(wp_id=3).parent.wp_id, 1)
+
+    @responses.activate
+    @override_settings(WPI_BULK_BATCH_SIZE=1)
+    def test_deferred_passes_in_chunks(self):
+        """Test that the deferred passes read back the imported records in chunks."""
+        self.add_pages(
+            self.url,
+            [
+                [
+                    make_category(1),
+                    make_category(2, parent=3),
+                    make_category(3, parent=1),
+                ]
+            ],
+        )
+        importer = Importer(self.url, "WPCategory")
+        importer.import_data()
+
+        self.assertEqual(importer.imported_wp_ids, [1, 2, 3])
+        self.assertEqual(
+            [len(chunk) for chunk in importer.iter_deferred_records("wp_foreign_keys")],
+            [1, 1, 1],
+        )
+        self.assertEqual(WPCategory.objects.get(wp_id=2).parent.wp_id, 3)
+        self.assertEqual(WPCategory.objects.get(wp_id=3).parent.wp_id, 1)
+
+    @responses.activate
+    def test_process_fk_objects_queries(self):
+        """Test that foreign keys are resolved with a query per related model."""
+        self.add_pages(
+            self.url,
+            [
+                [
+                    make_category(1),
+                    make_category(2, parent=1),
+                    make_category(3, parent=9),
+                ]
+            ],
+        )
+        Importer(self.url, "WPCategory").import_data()
+        WPCategory.objects.update(parent=None)
+        records = list(WPCategory.objects.values_list("pk", "wp_foreign_keys"))
+
+        # one query for the wp_id -> pk map and one bulk update
+        with self.assertNumQueries(2):
+            Importer.process_fk_objects(WPCategory, records)
+
+        self.assertEqual(WPCategory.objects.get(wp_id=2).parent.wp_id, 1)
+        self.assertIsNone(WPCategory.objects.get(wp_id=3).parent)
+
+    @responses.activate
+    def test_unchanged_records_are_skipped(self):
+        """Test that records with the same source hash are skipped unless forced."""
+        self.add_pages(self.url, [[make_category(1), make_category(2)]])
+        Importer(self.url, "WPCategory").import_data()
+
+        responses.reset()
+        self.add_pages(self.url, [[make_category(1), make_category(2, name="New")]])
+        importer = Importer(self.url, "WPCategory")
+        importer.import_data()
+
+        self.assertEqual((importer.updated, importer.skipped), (1, 1))
+        self.assertEqual(importer.imported_wp_ids, [2])
+        self.assertEqual(WPCategory.objects.get(wp_id=2).name, "New")
+
+        responses.reset()
+        self.add_pages(self.url, [[make_category(1), make_category(2, name="New")]])
+        importer = Importer(self.url, "WPCategory", force=True)
+        importer.import_data()
+        self.assertEqual((importer.updated, importer.skipped), (2, 0))
+
+    @responses.activate
+    def test_save_objects(self):
+        """Test that a page is upserted and the created/updated counts returned."""
+        self.add_pages(self.url, [[make_category(1)]])
+        importer = Importer(self.url, "WPCategory")
+        importer.import_data()
+
+        objects = [
+            importer.import_item(make_category(1, name="Renamed")),
+            importer.import_item(make_category(2)),
+            importer.import_item(make_category(2, name="Last")),
+        ]
+        created, updated, wp_ids = importer.save_objects(objects)
+
+        self.assertEqual((created, updated), (1, 1))
+        self.assertEqual(wp_ids, [1, 2])
+        self.assertEqual(
+            sorted(WPCategory.objects.values_list("wp_id", "name")),
+            [(1, "Renamed"), (2, "Last")],
+        )
+        self.assertEqual(WPCategory.objects.count(), 2)
+
+    @responses.activate
+    def test_fetch_stage_alone_isnt_skipped(self):
+        """Test that records fetched without their relations are imported again."""
+        pages = [[make_category(1), make_category(2, parent=1)]]
+        self.add_pages(self.url, pages)
+        Importer(self.url, "WPCategory", stages=["fetch"]).import_data()
+        self.assertIsNone(WPCategory.objects.get(wp_id=2).parent)
+
+        responses.reset()
+        self.add_pages(self.url, pages)
+        importer = Importer(self.url, "WPCategory")
+        importer.import_data()
+
+        self.assertEqual(importer.skipped, 0)
+        self.assertEqual(WPCategory.objects.get(wp_id=2).parent.wp_id, 1)
+
+    @override_settings(WPI_STREAM_CHUNK_SIZE=2)
+    def test_iter_item_chunks(self):
+        """Test that streamed items are read in chunks and parsed pages at once."""
+        items = [make_category(wp_id) for wp_id in [1, 2, 3]]
+        chunks = Importer.iter_item_chunks(iter(items))
+        self.assertEqual(list(chunks), [items[:2], items[2:]])
+        self.assertEqual(list(Importer.iter_item_chunks(items)), [items])
+
+    @responses.activate
+    def test_sync_deletions(self):
+        """Test that the records no longer in WordPress are deleted."""
+        self.add_pages(
+            self.url, [[make_category(1), make_category(2)], [make_category(3)]]
+        )
+        Importer(self.url, "WPCategory").import_data()
+
+        responses.reset()
+        # a record was added while paging so an id is on two pages
+        self.add_pages(self.url, [[{"id": 1}, {"id": 2}], [{"id": 2}]])
+        importer = Importer(self.url, "WPCategory", stages=["relations"])
+
+        self.assertEqual(importer.sync_deletions(), 0)
+        self.assertEqual(WPCategory.objects.count(), 3)
+
+        responses.reset()
+        self.add_pages(self.url, [[{"id": 1}], [{"id": 3}]])
+        self.assertEqual(importer.sync_deletions(), 1)
+        self.assertEqual(
+            sorted(WPCategory.objects.values_list("wp_id", flat=True)), [1, 3]
+        )
+        params = responses.calls[-1].request.params
+        self.assertEqual((params["_fields"], params["per_page"]), ("id", "100"))
+
+    @responses.activate
+    def test_extraction_plan(self):
+        """Test that the extraction plan of a model is built once and resolves "self"."""
+        self.add_pages(self.url, [])
+        importer = Importer(self.url, "WPCategory")
+        plan = get_extraction_plan(WPCategory)
+
+        self.assertIs(get_extraction_plan(WPCategory), plan)
+        self.assertIs(importer.plan, plan)
+        self.assertEqual(plan.foreign_keys, (("parent", "WPCategory", "wp_id"),))
+        self.assertNotIn("parent", plan.import_fields)
+
+        obj = importer.import_item(make_category(2, parent=1))
+        self.assertEqual(
+            obj.wp_foreign_keys,
+            [{"parent": {"model": "WPCategory", "where": "wp_id", "value": 1}}],
+        )
+
+    @responses.activate
+    def test_request_params(self):
+        """Test that the max page size and only the imported fields are requested."""
+        self.add_pages(self.url, [[make_category(1)]])
+        Importer(self.url, "WPCategory").import_data()
+
+        params = responses.calls[0].request.params
+        self.assertEqual(params["per_page"], "100")
+        self.assertIn("parent", params["_fields"].split(","))
+
+    @responses.activate
+    @override_settings(WPI_STAGE_ALL_FIELDS=True)
+    def test_stage_all_fields(self):
+        """Test that every field is requested only when the items are staged."""
+        self.add_pages(self.url, [[make_category(1)]])
+        Importer(self.url, "WPCategory").import_data()
+        self.assertNotIn("_fields", responses.calls[0].request.params)
+
+        Importer(self.url, "WPCategory", stage=False)
+        self.assertIn("_fields", responses.calls[-1].request.params)
+
+
+class TestBatchImporter(ImporterTestCase):
+    """Test the transaction of each batch of pages."""
+
+    url = "https://example.com/wp-json/wp/v2/categories"
+    pages = [
+        [make_category(1)],
+        [make_category(2, parent=1)],
+        [make_category(3, parent=2)],
+    ]
+
+    @responses.activate
+    def test_failed_batch_is_rolled_back_and_resumed(self):
+        """Test that only the failed batch is rolled back and it can be resumed."""
+        self.add_pages(self.url, self.pages)
+        importer = Importer(self.url, "WPCategory", batch_size=2)
+        import_item = importer.import_item
+
+        def fail_on_third(item):
+            if item["id"] == 3:
+                raise ValueError("failed")
+            return import_item(item)
+
+        with mock.patch.object(importer, "import_item", side_effect=fail_on_third):
+            with self.assertRaises(ValueError):
+                importer.import_data()
+
+        # the first batch is pages 1 and 2
+        self.assertEqual(importer.last_committed_page, 2)
+        self.assertEqual(
+            sorted(WPCategory.objects.values_list("wp_id", flat=True)), [1, 2]
+        )
+
+        responses.reset()
+        self.add_pages(self.url, self.pages)
+        importer = Importer(self.url, "WPCategory", batch_size=2, start_page=3)
+        importer.import_data()
+
+        self.assertEqual(importer.imported_wp_ids, [3])
+        self.assertEqual(WPCategory.objects.count(), 3)
+        self.assertEqual(WPCategory.objects.get(wp_id=2).parent.wp_id, 1)
+        self.assertEqual(WPCategory.objects.get(wp_id=3).parent.wp_id, 2)
+
+    @responses.activate
+    def test_failed_first_batch(self):
+        self.add_pages(self.url, self.pages)
+        importer = Importer(self.url, "WPCategory", batch_size=2)
+
+        with mock.patch.object(importer, "save_objects", side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                importer.import_data()
+
+        self.assertEqual(importer.last_committed_page, 0)
+        self.assertFalse(WPCategory.objects.exists())
+
+
+class TestCheckpoint(ImporterTestCase):
+    """Test resuming imports from their checkpoint."""
+
+    url = TestBatchImporter.url
+    pages = TestBatchImporter.pages
+
+    def import_again(self):
+        responses.reset()
+        self.add_pages(self.url, self.pages)
+        importer = Importer(self.url, "WPCategory")
+        importer.import_data()
+        return importer
+
+    @responses.activate
+    def test_resume_fetch_phase(self):
+        """Test that the pages after the last committed page are imported."""
+        self.add_pages(self.url, self.pages)
+        importer = Importer(self.url, "WPCategory")
+        import_item = importer.import_item
+
+        def fail_on_third(item):
+            if item["id"] == 3:
+                raise ValueError("failed")
+            return import_item(item)
+
+        with mock.patch.object(importer, "import_item", side_effect=fail_on_third):
+            with self.assertRaises(ValueError):
+                importer.import_data()
+
+        checkpoint = ImportCheckpoint.objects.get(model="WPCategory")
+        self.assertEqual(checkpoint.phase, ImportCheckpoint.PHASE_FETCH)
+        self.assertEqual(checkpoint.last_page, 2)
+
+        importer = self.import_again()
+
+        self.assertEqual(importer.imported_wp_ids, [3])
+        self.assertIn("page=3", responses.calls[-1].request.url)
+        self.assertEqual(WPCategory.objects.get(wp_id=3).parent.wp_id, 2)
+
+    @responses.activate
+    def test_resume_foreign_keys_phase(self):
+        """Test that a failed foreign keys phase is resumed without fetching."""
+        self.add_pages(self.url, self.pages)
+        importer = Importer(self.url, "WPCategory")
+
+        with mock.patch.object(importer, "process_fk_objects", side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                importer.import_data()
+
+        checkpoint = ImportCheckpoint.objects.get(model="WPCategory")
+        self.assertEqual(checkpoint.phase, ImportCheckpoint.PHASE_FOREIGN_KEYS)
+        self.assertEqual(checkpoint.last_page, 3)
+
+        self.import_again()
+
+        # only the first page, fetched by the client for the headers
+        self.assertEqual(len(responses.calls), 1)
+        self.assertEqual(WPCategory.objects.get(wp_id=3).parent.wp_id, 2)
+        checkpoint.refresh_from_db()
+        self.assertEqual(checkpoint.phase, ImportCheckpoint.PHASE_COMPLETE)
+
+    @responses.activate
+    def test_changed_params_start_again(self):
+        """Test that a checkpoint isn't resumed with a different pagination."""
+        self.add_pages(self.url, self.pages)
+        importer = Importer(self.url, "WPCategory")
+        with mock.patch.object(
+            importer, "process_fk_objects", side_effect=ValueError
+        ), self.assertRaises(ValueError):
+            importer.import_data()
+
+        checkpoint = ImportCheckpoint.objects.get(model="WPCategory")
+        self.assertIn("per_page=100", checkpoint.url)
+        self.assertIn("_fields=", checkpoint.url)
+
+        responses.reset()
+        self.add_pages(self.url, self.pages)
+        with override_settings(WPI_PER_PAGE=50):
+            importer = Importer(self.url, "WPCategory")
+            importer.import_data()
+
+        self.assertFalse(importer.resumed)
+        checkpoint.refresh_from_db()
+        self.assertIn("per_page=50", checkpoint.url)
+
+    @responses.activate
+    def test_restart_after_failed_foreign_keys_phase(self):
+        """Test that restarting resolves the relations a failed import didn't."""
+        self.add_pages(self.url, self.pages)
+        importer = Importer(self.url, "WPCategory")
+
+        with mock.patch.object(importer, "process_fk_objects", side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                importer.import_data()
+
+        responses.reset()
+        self.add_pages(self.url, self.pages)
+        importer = Importer(self.url, "WPCategory", restart=True)
+        importer.import_data()
+
+        # only the category without a parent was fully imported
+        self.assertEqual(importer.imported_wp_ids, [2, 3])
+        self.assertEqual(WPCategory.objects.get(wp_id=3).parent.wp_id, 2)
+
+
+class TestUniqueFieldsImporter(ImporterTestCase):
+    """Test importing a model with UNIQUE_FIELDS."""
+
+    url = "https://example.com/wp-json/wp/v2/tags"
+
+    @responses.activate
+    def test_duplicates_are_skipped(self):
+        """Test that duplicate names are skipped without a query per item."""
+        WPTag.objects.create(
+            wp_id=1, name="Existing", link="https://example.com/", slug="existing"
+        )
+        self.add_pages(
+            self.url,
+            [
+                [make_tag(2, "Existing"), make_tag(3, "New")],
+                [make_tag(4, "New"), make_tag(5)],
+            ],
+        )
+        importer = Importer(self.url, "WPTag")
+
+        with mock.patch.object(
+            importer, "get_unique_keys", wraps=importer.get_unique_keys
+        ) as get_unique_keys:
+            importer.import_data()
+
+        get_unique_keys.assert_called_once()
+        self.assertEqual(
+            sorted(WPTag.objects.values_list("wp_id", "name")),
+            [(1, "Existing"), (3, "New"), (5, "Tag 5")],
+        )
+
+
+class TestPostImporter(ImporterTestCase):
+    """Test importing posts, which have cleaned and block content."""
+
+    url = "https://example.com/wp-json/wp/v2/posts"
+
+    @responses.activate
+    def test_content_is_written_once(self):
+        """Test that the derived content is saved by the upsert, not updated later."""
+        WPAuthor.objects.create(
+            wp_id=7, name="Author", link="https://example.com/", slug="author"
+        )
+        self.add_pages(
+            self.url, [[make_post(1, author=7, content="<div><p>Hello</p></div>")]]
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            Importer(self.url, "WPPost").import_data()
+
+        post = WPPost.objects.get(wp_id=1)
+        self.assertEqual(post.author.wp_id, 7)
+        self.assertEqual(post.wp_cleaned_content, "<p>Hello</p>")
+        self.assertEqual(post.wp_block_content, [])
+
+        updates = [
+            q["sql"]
+            for q in queries
+            if q["sql"].startswith('UPDATE "wordpress_wppost"')
+        ]
+        # the foreign keys, then the source hash once they're resolved
+        self.assertEqual(len(updates), 2)
+        self.assertNotIn("content", updates[0])
+        self.assertNotIn("content", updates[1])
+        self.assertIn("wp_source_hash", updates[1])
+
+    @responses.activate
+    def test_content_is_built_by_processes(self):
+        """Test that a pool of processes builds the same content."""
+        StreamBlockSignatureBlocks.objects.create(
+            signature="p:",
+            block_name="wagtail_toolbox.wordpress.wagtail_builder_utils.richtext_block_builder",
+        )
+        content = "<div><p>Hello</p></div><p>World</p>"
+        self.add_pages(self.url, [[make_post(1, content=content)]])
+        Importer(self.url, "WPPost").import_data()
+        serial = WPPost.objects.values_list("wp_cleaned_content", "wp_block_content")
+        serial = list(serial)
+        WPPost.objects.all().delete()
+
+        responses.reset()
+        self.add_pages(self.url, [[make_post(1, content=content)]])
+        Importer(self.url, "WPPost", processes=2).import_data()
+        post = WPPost.objects.get(wp_id=1)
+
+        self.assertEqual([(post.wp_cleaned_content, post.wp_block_content)], serial)
+        self.assertEqual(
+            post.wp_block_content,
+            [{"type": "rich_text", "value": "<p>Hello</p><p>World</p>"}],
+        )
+
+    @responses.activate
+    def test_stages(self):
+        """Test that the blocks can be rebuilt from the existing records alone."""
+        content = "<div><p>Hello</p></div><p>World</p>"
+        self.add_pages(self.url, [[make_post(1, content=content)]])
+        Importer(self.url, "WPPost", stages=["fetch", "clean"]).import_data()
+
+        post = WPPost.objects.get(wp_id=1)
+        self.assertEqual(post.wp_cleaned_content, "<p>Hello</p><p>World</p>")
+        self.assertEqual(post.wp_block_content, None)
+        # imported again by the next full import as its blocks weren't built
+        self.assertEqual(post.wp_source_hash, None)
+
+        calls = len(responses.calls)
+        StreamBlockSignatureBlocks.objects.create(
+            signature="p:",
+            block_name="wagtail_toolbox.wordpress.wagtail_builder_utils.richtext_block_builder",
+        )
+        Importer(self.url, "WPPost", stages=["blocks"], processes=2).import_data()
+
+        post.refresh_from_db()
+        self.assertEqual(
+            post.wp_block_content,
+            [{"type": "rich_text", "value": "<p>Hello</p><p>World</p>"}],
+        )
+        self.assertEqual(len(responses.calls), calls)
+
+    @responses.activate
+    def test_unresolved_relations_are_imported_again(self):
+        """Test that a post isn't skipped until its relations have been resolved."""
+        self.add_pages(self.url, [[make_post(1, tags=[5])]])
+        Importer(self.url, "WPPost").import_data()
+        self.assertIsNone(WPPost.objects.get(wp_id=1).wp_source_hash)
+
+        WPTag.objects.create(
+            wp_id=5, name="Tag", link="https://example.com/", slug="tag"
+        )
+        for skipped in [0, 1]:
+            responses.reset()
+            self.add_pages(self.url, [[make_post(1, tags=[5])]])
+            importer = Importer(self.url, "WPPost")
+            importer.import_data()
+            self.assertEqual(importer.skipped, skipped)
+
+        post = WPPost.objects.get(wp_id=1)
+        self.assertEqual(list(post.tags.values_list("wp_id", flat=True)), [5])
+
+    @responses.activate
+    @override_settings(WPI_BULK_BATCH_SIZE=1)
+    def test_unresolved_reported_once(self):
+        """Test that the missing related objects of every chunk are reported together."""
+        self.add_pages(self.url, [[make_post(1, tags=[6]), make_post(2, tags=[7])]])
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            Importer(self.url, "WPPost").import_data()
+
+        output = stdout.getvalue()
+        self.assertEqual(output.count("Processing many to many keys..."), 1)
+        self.assertEqual(output.count("Could not find"), 1)
+        self.assertIn("Could not find 2 WPTag objects: [6, 7]", output)
+
+    @responses.activate
+    def test_sync_deletions_keeps_attached_media(self):
+        """Test that deleting a post keeps its media and only removes its links."""
+        tag = WPTag.objects.create(
+            wp_id=5, name="Tag", link="https://example.com/", slug="tag"
+        )
+        deleted, kept = [WPPost.objects.create(**self.post(i)) for i in [1, 2]]
+        deleted.tags.add(tag)
+        kept.tags.add(tag)
+        fields = {field.name for field in WPMedia._meta.fields}
+        data = {k: v for k, v in make_media(9).items() if k in fields}
+        data.update(
+            wp_id=9,
+            title="Media 9",
+            guid="https://example.com/?attachment_id=9",
+            description="",
+            caption="",
+            author=None,
+            post=deleted,
+        )
+        media = WPMedia.objects.create(**data)
+
+        self.add_pages(self.url, [[{"id": 2}]])
+        importer = Importer(self.url, "WPPost", stages=["relations"])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(importer.sync_deletions(), 1)
+
+        self.assertEqual(list(WPPost.objects.values_list("wp_id", flat=True)), [2])
+        media.refresh_from_db()
+        self.assertIsNone(media.post)
+        self.assertEqual(list(tag.wppost_set.all()), [kept])
+        deletes = [
+            q["sql"]
+            for q in queries
+            if q["sql"].startswith('DELETE FROM "wordpress_wppost"')
+        ]
+        self.assertEqual(len(deletes), 1)
+
+    def test_process_mtm_objects(self):
+        """Test that the through table rows are inserted in bulk, once."""
+        for wp_id in [1, 2]:
+            WPCategory.objects.create(
+                wp_id=wp_id, name="Category", link="https://example.com/", slug="c"
+            )
+        WPTag.objects.create(
+            wp_id=5, name="Tag", link="https://example.com/", slug="tag"
+        )
+        post = WPPost.objects.create(
+            **self.post(1),
+            wp_many_to_many_keys=[
+                {
+                    "categories": {
+                        "model": "WPCategory",
+                        "where": "wp_id",
+                        "value": [1, 2],
+                    }
+                },
+                {"tags": {"model": "WPTag", "where": "wp_id", "value": [5, 6]}},
+            ],
+        )
+
+        records = [(post.pk, post.wp_many_to_many_keys)]
+
+        # a wp_id -> pk map and an insert for each related model
+        with self.assertNumQueries(4):
+            Importer.process_mtm_objects(WPPost, records)
+        Importer.process_mtm_objects(WPPost, records)
+
+        self.assertEqual(
+            sorted(post.categories.values_list("wp_id", flat=True)), [1, 2]
+        )
+        self.assertEqual(list(post.tags.values_list("wp_id", flat=True)), [5])
+
+    @staticmethod
+    def post(wp_id):
+        data = make_post(wp_id)
+        fields = {field.name for field in WPPost._meta.fields}
+        data = {key: value for key, value in data.items() if key in fields}
+        data.update(
+            wp_id=wp_id,
+            title=f"Post {wp_id}",
+            guid=f"https://example.com/?p={wp_id}",
+            content="",
+            excerpt="",
+            author=None,
+        )
+        return data
+
+
+class TestIncrementalImporter(ImporterTestCase):
+    """Test incremental imports."""
+
+    url = "https://example.com/wp-json/wp/v2/media"
+
+    def setUp(self):
+        host = WordpressHost.objects.create(site=Site.objects.first())
+        self.endpoint = WordpressEndpoint.objects.create(
+            name="media", url=self.url, model="WPMedia", setting=host
+        )
+
+    @responses.activate
+    def test_stores_last_modified_gmt(self):
+        """Test that the highest modified_gmt imported is stored on the endpoint."""
+        self.add_pages(
+            self.url,
+            [
+                [
+                    make_media(1, "2023-01-03T10:00:00"),
+                    make_media(2, "2023-01-05T10:00:00"),
+                ],
+                [make_media(3, "2023-01-04T10:00:00")],
+            ],
+        )
+        Importer(self.url, "WPMedia").import_data()
+
+        self.endpoint.refresh_from_db()
+        self.assertEqual(WPMedia.objects.count(), 3)
+        self.assertEqual(
+            self.endpoint.last_modified_gmt, datetime.datetime(2023, 1, 5, 10)
+        )
+
+    @responses.activate
+    def test_incremental_requests_modified_after(self):
+        """Test that incremental imports only request the records modified since."""
+        self.endpoint.last_modified_gmt = datetime.datetime(2023, 1, 5, 10)
+        self.endpoint.save()
+        self.add_pages(self.url, [[make_media(4, "2023-01-06T10:00:00")]])
+
+        Importer(self.url, "WPMedia", incremental=True).import_data()
+
+        params = responses.calls[0].request.params
+        self.assertEqual(params["modified_after"], "2023-01-05T10:00:00Z")
+        self.assertEqual(params["orderby"], "modified")
+        self.endpoint.refresh_from_db()
+        self.assertEqual(
+            self.endpoint.last_modified_gmt, datetime.datetime(2023, 1, 6, 10)
+        )
+
+    @responses.activate
+    def test_incremental_without_last_modified_gmt(self):
+        """Test that the first incremental import requests everything."""
+        self.add_pages(self.url, [[make_media(1)]])
+        Importer(self.url, "WPMedia", incremental=True).import_data()
+
+        self.assertNotIn("modified_after", responses.calls[0].request.params)
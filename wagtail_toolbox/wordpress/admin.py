@@ -5,6 +5,7 @@ from django.forms import Textarea, TextInput
 from django.utils.safestring import mark_safe
 
 from wagtail_toolbox.wordpress.models import (
+    ImportCheckpoint,
     StreamBlockSignatureBlocks,
     WPAuthor,
     WPCategory,
@@ -319,3 +320,16 @@ class StreamBlockSignatureBlocksAdmin(admin.ModelAdmin):
 wordpress_import_admin_site.register(
     StreamBlockSignatureBlocks, StreamBlockSignatureBlocksAdmin
 )
+
+
+class ImportCheckpointAdmin(admin.ModelAdmin):
+    list_display = [
+        "model",
+        "phase",
+        "last_page",
+        "url",
+        "updated",
+    ]
+
+
+wordpress_import_admin_site.register(ImportCheckpoint, ImportCheckpointAdmin)
@@ -1,37 +1,340 @@
+import asyncio
+import codecs
+import datetime
+import json
+import random
 import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode
 
 import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from wagtail_toolbox.wordpress.metrics import metrics
+from wagtail_toolbox.wordpress.response_cache import get_response_cache
 
 _session = requests.Session()
 
+# Responses worth retrying, the host is throttling or temporarily failing.
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
 
-class Client:
-    """A simple client for the WordPress REST API.
-    On been instantiated, the client will fetch the first page of the endpoint.
+# the characters a JSON number can carry on with
+NUMBER_CHARACTERS = "0123456789.eE+-"
 
-    It will set the following class properties that can be used to determine:
-    - is_paged: True if the endpoint is paged, False otherwise.
-    - total_pages: The total number of pages.
-    - total_results: The total number of results.
-    - paged_endpoints: A list of URLs that can be fetched.
 
-    Calling the get() method will return the JSON response from the endpoint.
+class AdaptiveLimiter:
+    """Limit the number of requests in flight, adapting the limit to the error rate.
+
+    Use it as a context manager around each request. The limit is halved
+    each time the host throttles or fails a request and grows by one
+    after as many requests in a row as the current limit have succeeded,
+    so it settles on the fastest rate the host can sustain, between 1
+    and max_limit.
     """
 
-    def __init__(self, url):
-        self.url = url
+    def __init__(self, max_limit):
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self.in_flight = 0
+        self.successes = 0
+        self.condition = threading.Condition()
 
-        try:
-            self.response = _session.get(self.url)
-            sys.stdout.write(f"Fetching {self.url}\n")
-        except Exception as e:
-            sys.stdout.write(f"Error: {e}\n")
+    def __enter__(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+        return self
 
-    def get(self, url):
+    def __exit__(self, *args):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def record_success(self):
+        with self.condition:
+            self.successes += 1
+            if self.successes >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self.successes = 0
+                self.condition.notify()
+
+    def record_failure(self):
+        with self.condition:
+            self.limit = max(1, self.limit // 2)
+            self.successes = 0
+
+
+# Shared by every Client so the total number of in-flight requests
+# stays below WPI_MAX_CONCURRENT_REQUESTS no matter how many endpoints
+# are being fetched at once.
+_request_slots = None
+_request_slots_lock = threading.Lock()
+
+
+def get_request_slots():
+    """Return the AdaptiveLimiter limiting in-flight requests across all clients.
+
+    The connection pool of the shared session is sized to match so
+    concurrent requests reuse connections instead of discarding them.
+    """
+    global _request_slots
+
+    with _request_slots_lock:
+        if _request_slots is None:
+            max_requests = getattr(settings, "WPI_MAX_CONCURRENT_REQUESTS", 8)
+            adapter = HTTPAdapter(pool_maxsize=max_requests)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _request_slots = AdaptiveLimiter(max_requests)
+
+    return _request_slots
+
+
+def get_retry_delay(attempt, response=None):
+    """Return the number of seconds to wait before retrying a request.
+
+    The Retry-After header of the response is honoured if there is one,
+    otherwise the delay grows exponentially with each attempt, with full
+    jitter so concurrent requests don't retry in lock step.
+    """
+    max_delay = getattr(settings, "WPI_RETRY_MAX_DELAY", 60)
+
+    retry_after = None if response is None else response.headers.get("Retry-After")
+    if retry_after:
         try:
-            return _session.get(url).json()
-        except Exception as e:
-            raise e
+            delay = float(retry_after)
+        except ValueError:
+            # or it's an HTTP date
+            try:
+                delay = (
+                    parsedate_to_datetime(retry_after)
+                    - datetime.datetime.now(datetime.timezone.utc)
+                ).total_seconds()
+            except (TypeError, ValueError):
+                delay = None
+        if delay is not None:
+            return min(max(delay, 0), max_delay)
+
+    backoff = getattr(settings, "WPI_RETRY_BACKOFF", 0.5)
+    return random.uniform(0, min(max_delay, backoff * 2**attempt))
+
+
+def iter_json_array(chunks):
+    """Yield each value of a JSON array as it's decoded from the byte chunks.
+
+    Only the value being decoded and the rest of the current chunks are
+    held in memory, not the whole array, so peak memory depends on the
+    size of the largest value and not on the size of the array.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    finished = False
+    expecting = "["
+
+    def read(buffer, size):
+        """Read at least size more characters, unless the chunks run out."""
+        nonlocal finished
+        target = len(buffer) + size
+        while len(buffer) < target and not finished:
+            chunk = next(chunks, None)
+            if chunk is None:
+                finished = True
+                buffer += utf8.decode(b"", final=True)
+            else:
+                buffer += utf8.decode(chunk)
+        return buffer
+
+    while True:
+        buffer = buffer.lstrip()
+        if not buffer:
+            if finished:
+                raise json.JSONDecodeError("Unterminated array", buffer, 0)
+            buffer = read(buffer, 1)
+            continue
+
+        if expecting == "[":
+            if buffer[0] != "[":
+                raise json.JSONDecodeError("Expecting '['", buffer, 0)
+            buffer = buffer[1:]
+            expecting = "value or ]"
+        elif buffer[0] == "]" and expecting != "value":
+            return
+        elif expecting == ", or ]":
+            if buffer[0] != ",":
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, 0)
+            buffer = buffer[1:]
+            expecting = "value"
+        else:
+            try:
+                value, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if finished:
+                    raise
+                # read at least as much again so a large value
+                # isn't decoded over and over for every chunk
+                buffer = read(buffer, len(buffer))
+                continue
+
+            if (
+                isinstance(value, (int, float))
+                and not finished
+                and not buffer[end:].strip(NUMBER_CHARACTERS)
+            ):
+                # the number may carry on in the next chunk, "6." or "6.5e"
+                # decode as a shorter number, read on until a delimiter
+                buffer = read(buffer, 1)
+                continue
+
+            buffer = buffer[end:]
+            expecting = ", or ]"
+            yield value
+
+
+class BaseClient:
+    """Behaviour shared by the synchronous and asyncio clients.
+
+    Subclasses must set self.url, self.params, the query parameters sent with
+    every page, and self.response, the response of the first page of the
+    endpoint, which holds the pagination headers.
+
+    If self.cache is a ResponseCache the responses are revalidated against it.
+
+    If self.stream is True the pages are parsed item by item as they are read
+    from the network, see iter_json_array. Streamed requests skip the cache,
+    as storing a response reads the whole body into memory.
+
+    Failed requests are retried up to WPI_MAX_RETRIES times, see get_retry_delay.
+
+    Every request is recorded in metrics against self.url.
+    """
+
+    cache = None
+    stream = False
+
+    def _request(self, url, params=None, stream=False):
+        if self.cache and not stream:
+            return self.cache.get(url, params=params, session=_session, stream=stream)
+        return _session.get(url, params=params, stream=stream)
+
+    def _get_response(self, url, params=None, stream=False):
+        """Request the url, limited by the shared request slots.
+
+        Connection errors, timeouts and RETRY_STATUS_CODES responses are
+        retried, once retries run out the error is raised.
+
+        The latency of the last attempt and the number of retries are set
+        on the response as response.latency and response.retries.
+        """
+        max_retries = getattr(settings, "WPI_MAX_RETRIES", 5)
+        request_slots = get_request_slots()
+
+        for attempt in range(max_retries + 1):
+            response = None
+            try:
+                with request_slots:
+                    started = time.perf_counter()
+                    response = self._request(url, params, stream)
+                    response.latency = time.perf_counter() - started
+                    response.retries = attempt
+            except (requests.ConnectionError, requests.Timeout) as e:
+                request_slots.record_failure()
+                if attempt == max_retries:
+                    raise
+                error = e
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    request_slots.record_success()
+                    return response
+                request_slots.record_failure()
+                if attempt == max_retries:
+                    response.raise_for_status()
+                error = f"{response.status_code} {response.reason}"
+
+            delay = get_retry_delay(attempt, response)
+            sys.stdout.write(f"Retrying {url} in {delay:.1f}s: {error}\n")
+            time.sleep(delay)
+
+    def _get_first_page(self):
+        """Fetch, record and return the response of the first page.
+
+        Only its headers are used, if it can't be fetched there's nothing
+        to page through so the error is raised.
+        """
+        response = self._get_response(self.url, self.params, self.stream)
+        if self.stream:
+            response.close()
+        self._record(
+            self.url,
+            response,
+            0 if self.stream else len(response.content),
+        )
+        response.raise_for_status()
+        sys.stdout.write(f"Fetching {self.url}\n")
+        return response
+
+    def _record(self, url, response, size, decode_time=0.0):
+        metrics.record(
+            self.url,
+            url,
+            response.status_code,
+            response.latency,
+            size,
+            retries=response.retries,
+            decode_time=decode_time,
+        )
+
+    def _get_json(self, url):
+        response = self._get_response(url)
+        response.raise_for_status()
+        started = time.perf_counter()
+        json_response = response.json()
+        self._record(
+            url, response, len(response.content), time.perf_counter() - started
+        )
+        return json_response
+
+    def _iter_json(self, url):
+        """Yield each item of the url as it's read from the response."""
+        size = 0
+        read_time = 0.0  # time spent waiting on the network
+        decode_time = 0.0
+
+        def read_chunks():
+            nonlocal size, read_time
+            chunks = response.iter_content(chunk_size=64 * 1024)
+            while True:
+                started = time.perf_counter()
+                chunk = next(chunks, None)
+                read_time += time.perf_counter() - started
+                if chunk is None:
+                    return
+                size += len(chunk)
+                yield chunk
+
+        with self._get_response(url, stream=True) as response:
+            response.raise_for_status()
+            items = iter_json_array(read_chunks())
+            finished = object()
+            while True:
+                started, read_started = time.perf_counter(), read_time
+                item = next(items, finished)
+                decode_time += (time.perf_counter() - started) - (
+                    read_time - read_started
+                )
+                if item is finished:
+                    break
+                yield item
+
+        response.latency += read_time
+        self._record(url, response, size, decode_time)
 
     @property
     def is_paged(self):
@@ -50,9 +353,6 @@ class Client:
 
     @property
     def paged_endpoints(self):
-        # TODO: This should be a generator.
-        # and the Client would be used differently
-        # in the WordPressImport class.
         """Generate a list of URLs that can be fetched.
         The 'page' parameter is always appended to the URL.
         Returns:
@@ -63,7 +363,195 @@ class Client:
                 "https://foo.com/endpoint/bar/baz?page=2",
             ]
         """
+        return list(self.iter_paged_endpoints())
 
+    def iter_paged_endpoints(self):
+        """Lazily yield the URLs of paged_endpoints."""
         total_pages = self.get_total_pages
 
-        return [f"{self.url}?page={index}" for index in range(1, total_pages + 1)]
+        for index in range(1, total_pages + 1):
+            yield f"{self.url}?{urlencode({**self.params, 'page': index})}"
+
+
+class Client(BaseClient):
+    """A simple client for the WordPress REST API.
+    On been instantiated, the client will fetch the first page of the endpoint.
+
+    It will set the following class properties that can be used to determine:
+    - is_paged: True if the endpoint is paged, False otherwise.
+    - total_pages: The total number of pages.
+    - total_results: The total number of results.
+    - paged_endpoints: A list of URLs that can be fetched.
+
+    Calling the get() method will return the JSON response from the endpoint.
+    Calling the fetch_pages() method will fetch the paged endpoints,
+    optionally concurrently, and yield them in page order.
+    Calling the iter_items() method will yield each item of the paged endpoints
+    while the next pages are fetched in the background.
+    """
+
+    def __init__(
+        self,
+        url,
+        max_workers=None,
+        prefetch=None,
+        params=None,
+        cache=None,
+        stream=None,
+    ):
+        self.url = url
+        # e.g. {"per_page": 100, "_fields": "id,title"}
+        self.params = params or {}
+        # a ResponseCache, defaults to one if WPI_CACHE_ENABLED is set
+        self.cache = cache or get_response_cache()
+        # The number of requests for this endpoint that can be in flight at once.
+        self.max_workers = max_workers or getattr(
+            settings, "WPI_ENDPOINT_CONCURRENT_REQUESTS", 1
+        )
+        # The number of pages fetched ahead of the page being processed.
+        self.prefetch = (
+            prefetch
+            if prefetch is not None
+            else getattr(settings, "WPI_PREFETCH_PAGES", 1)
+        )
+        # Parse the pages item by item instead of all at once.
+        self.stream = (
+            stream
+            if stream is not None
+            else getattr(settings, "WPI_STREAM_JSON", False)
+        )
+
+        self.response = self._get_first_page()
+
+    def get(self, url):
+        try:
+            return self._get_json(url)
+        except Exception as e:
+            raise e
+
+    def fetch_pages(self, urls=None, max_workers=None, prefetch=None):
+        """Fetch each url and yield a (url, json) tuple in the order given.
+
+        Args:
+            urls (iterable): The urls to fetch, defaults to the paged endpoints.
+            max_workers (int): The number of requests in flight at once,
+                defaults to the max_workers of the client.
+            prefetch (int): The number of extra pages to fetch ahead,
+                defaults to the prefetch of the client.
+
+        Up to max_workers + prefetch pages are fetched ahead of the page being
+        yielded, so the order stays deterministic while the network is kept
+        busy, and no more than that many pages are ever held in memory.
+
+        If the client streams, the pages are fetched one at a time and the json
+        is an iterator that parses the items as they're read from the network.
+        """
+        urls = self.iter_paged_endpoints() if urls is None else urls
+
+        if self.stream:
+            for url in urls:
+                yield url, self._iter_json(url)
+            return
+
+        max_workers = max_workers or self.max_workers
+        prefetch = self.prefetch if prefetch is None else prefetch
+        read_ahead = max_workers + prefetch
+
+        if read_ahead <= 1:
+            for url in urls:
+                yield url, self.get(url)
+            return
+
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            try:
+                for url in urls:
+                    pending.append((url, executor.submit(self.get, url)))
+                    if len(pending) >= read_ahead:
+                        url, future = pending.popleft()
+                        yield url, future.result()
+
+                while pending:
+                    url, future = pending.popleft()
+                    yield url, future.result()
+            finally:
+                # don't wait on pages nobody is going to read
+                for _, future in pending:
+                    future.cancel()
+
+    def iter_items(self, urls=None, max_workers=None, prefetch=None):
+        """Yield each item of each page in the order given.
+
+        The following pages are fetched in the background while the items of
+        the current page are being processed.
+        """
+        for _, json_response in self.fetch_pages(urls, max_workers, prefetch):
+            yield from json_response
+
+
+class AsyncClient(BaseClient):
+    """An asyncio interface to the Client.
+
+    Create it with `await AsyncClient.create(url)`, which fetches the first page
+    of the endpoint, then iterate the pages or the items asynchronously:
+
+        async for item in client.iter_items():
+            ...
+
+    It isn't an asyncio-native HTTP client: it's a thread-backed wrapper that
+    runs the same blocking requests calls in the event loop's default
+    executor, sharing the request slots of the synchronous client. It's for
+    code that's already async; the import commands use the Client from
+    threads instead.
+    """
+
+    def __init__(self, url, max_workers=None, params=None, cache=None):
+        self.url = url
+        self.params = params or {}
+        self.cache = cache or get_response_cache()
+        self.max_workers = max_workers or getattr(
+            settings, "WPI_ENDPOINT_CONCURRENT_REQUESTS", 1
+        )
+        self.response = None
+
+    @classmethod
+    async def create(cls, url, max_workers=None, params=None, cache=None):
+        """Instantiate the client and fetch the first page of the endpoint."""
+        client = cls(url, max_workers=max_workers, params=params, cache=cache)
+        loop = asyncio.get_running_loop()
+        client.response = await loop.run_in_executor(None, client._get_first_page)
+        return client
+
+    async def get(self, url):
+        """Return the JSON response from the url."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._get_json, url)
+
+    async def iter_pages(self, urls=None, max_workers=None):
+        """Fetch each url and yield a (url, json) tuple in the order given.
+
+        Up to max_workers pages are fetched ahead of the page being yielded.
+        """
+        urls = self.iter_paged_endpoints() if urls is None else urls
+        max_workers = max_workers or self.max_workers
+
+        pending = deque()
+        try:
+            for url in urls:
+                pending.append((url, asyncio.ensure_future(self.get(url))))
+                if len(pending) >= max_workers:
+                    url, task = pending.popleft()
+                    yield url, await task
+
+            while pending:
+                url, task = pending.popleft()
+                yield url, await task
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+    async def iter_items(self, urls=None, max_workers=None):
+        """Yield each item of each page in the order given."""
+        async for _, json_response in self.iter_pages(urls, max_workers):
+            for item in json_response:
+                yield item
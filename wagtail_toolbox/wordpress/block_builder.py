@@ -8,7 +8,15 @@ from wagtail_toolbox.wordpress.models.config import StreamBlockSignatureBlocks
 
 
 class WagtailBlockBuilder:
-    def __init__(self, fallback_block_name=None, rich_text_block_name=None):
+    def __init__(
+        self,
+        fallback_block_name=None,
+        rich_text_block_name=None,
+        stream_block_signatures=None,
+    ):
+        """Pass the (signature, block_name, block_kwargs) of the
+        StreamBlockSignatureBlocks as stream_block_signatures to build blocks
+        without querying the database, e.g. in another process."""
         if fallback_block_name is None and not hasattr(
             settings, "WPI_FALLBACK_BLOCK_NAME"
         ):
@@ -28,7 +36,16 @@ class WagtailBlockBuilder:
             self.rich_text_block = settings.WPI_RICHTEXT_BLOCK_NAME
 
         self.stream_blocks = []
-        self.stream_block_signatures = (
+        if stream_block_signatures is None:
+            stream_block_signatures = self.load_stream_block_signatures()
+        self.stream_block_signatures = {
+            signature[0]: signature for signature in stream_block_signatures
+        }
+
+    @staticmethod
+    def load_stream_block_signatures():
+        """Return a list of (signature, block_name, block_kwargs)."""
+        return list(
             StreamBlockSignatureBlocks.objects.all().values_list(
                 "signature", "block_name", "block_kwargs"
             )
@@ -51,11 +68,8 @@ class WagtailBlockBuilder:
         for element in soup.findChildren(recursive=False):
             signature = self.make_tag_signature(element)
 
-            try:
-                stream_block_config = self.stream_block_signatures.get(
-                    signature=signature
-                )
-            except StreamBlockSignatureBlocks.DoesNotExist:
+            stream_block_config = self.stream_block_signatures.get(signature)
+            if stream_block_config is None:
                 sys.stderr.write(f"Signature not found: {signature}\n")
                 continue
 
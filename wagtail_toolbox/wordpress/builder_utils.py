@@ -1,3 +1,5 @@
+import time
+
 import requests
 from bs4 import BeautifulSoup as bs4
 from django.conf import settings
@@ -8,6 +10,9 @@ from django.core.files.temp import NamedTemporaryFile
 from wagtail.documents import get_document_model
 from wagtail.images import get_image_model
 
+from wagtail_toolbox.wordpress.metrics import metrics
+from wagtail_toolbox.wordpress.response_cache import get_media_cache
+
 ImportedImage = get_image_model()
 ImportedDocument = get_document_model()
 
@@ -76,9 +81,15 @@ def make_tag_signature(soup):
 
 
 def fetch_url(src, allow_redirects=True):
-    """general purpose url fetcher with ability to pass in own config"""
+    """general purpose url fetcher with ability to pass in own config
+
+    If WPI_CACHE_ENABLED is set the response is revalidated against the
+    media cache, kept apart from the API pages so they aren't pushed out."""
+    cache = get_media_cache()
+    get = cache.get if cache else requests.get
     try:
-        response = requests.get(
+        started = time.perf_counter()
+        response = get(
             src,
             **getattr(
                 settings,
@@ -91,6 +102,15 @@ def fetch_url(src, allow_redirects=True):
                 },
             ),
         )
+        metrics.record(
+            "fetch_url",
+            src,
+            response.status_code,
+            time.perf_counter() - started,
+            # the body is read by every caller anyway, and unlike the
+            # content-length header it's there for chunked responses
+            len(response.content),
+        )
         status = True if response.status_code == 200 else False
         return response, status, response.headers.get("content-type")
     except requests.ConnectionError:
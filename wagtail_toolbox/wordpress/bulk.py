@@ -0,0 +1,30 @@
+from django.db import connections, router
+
+
+def bulk_upsert(model, objects, unique_fields, update_fields):
+    """Insert the objects, updating update_fields of those that already exist.
+
+    An object exists if a row has the same unique_fields. It's one statement
+    per batch where the database supports it.
+    """
+    features = connections[router.db_for_write(model)].features
+
+    if getattr(features, "supports_update_conflicts_with_target", False):
+        model.objects.bulk_create(
+            objects,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=update_fields,
+        )
+    elif getattr(features, "supports_update_conflicts", False):
+        # e.g. MySQL, which uses the unique fields without being told
+        model.objects.bulk_create(
+            objects, update_conflicts=True, update_fields=update_fields
+        )
+    else:
+        # Django < 4.1 can't upsert
+        for obj in objects:
+            model.objects.update_or_create(
+                **{field: getattr(obj, field) for field in unique_fields},
+                defaults={field: getattr(obj, field) for field in update_fields},
+            )
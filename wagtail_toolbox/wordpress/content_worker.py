@@ -0,0 +1,14 @@
+import django
+
+# The stream block signatures of this process, set by init_content_worker.
+# This module doesn't import any models so the pool can unpickle the
+# initializer before Django is set up.
+stream_block_signatures = None
+
+
+def init_content_worker(signatures):
+    """Set up Django and the signatures once in each process of the pool,
+    so they aren't sent again with every item."""
+    global stream_block_signatures
+    django.setup()
+    stream_block_signatures = signatures
@@ -0,0 +1,101 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.apps import apps
+
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+def get_model_dependencies(model_names):
+    """Return a dict of each model name and the set of model names it depends on.
+
+    A model depends on the models its process_foreign_keys and
+    process_many_to_many_keys point at, as their wp_ids are resolved
+    against the imported records. References to the model itself
+    (e.g. a parent category) are resolved by the model's own import so
+    they are ignored, as are models that aren't in model_names.
+    """
+    dependencies = {}
+    for model_name in model_names:
+        model = apps.get_model("wordpress", model_name)
+        keys = model.process_foreign_keys() + model.process_many_to_many_keys()
+        dependencies[model_name] = {
+            relation["model"]
+            for field in keys
+            for relation in field.values()
+            if relation["model"] not in ["self", model_name]
+            and relation["model"] in model_names
+        }
+    return dependencies
+
+
+def check_dependencies(dependencies):
+    """Raise a ValueError if the dependencies have a cycle."""
+    remaining = {name: set(depends_on) for name, depends_on in dependencies.items()}
+    while remaining:
+        ready = [name for name, depends_on in remaining.items() if not depends_on]
+        if not ready:
+            raise ValueError(
+                f"The models have circular dependencies: {', '.join(sorted(remaining))}"
+            )
+        for name in ready:
+            del remaining[name]
+        for depends_on in remaining.values():
+            depends_on.difference_update(ready)
+
+
+def run_in_dependency_order(dependencies, run, max_workers=4):
+    """Call run(name) for each name in dependencies using a pool of threads.
+
+    Each name is started as soon as everything it depends on has succeeded,
+    so independent names run concurrently. If run raises, everything that
+    depends on that name, directly or not, is skipped.
+
+    With max_workers of 1 the names are run one at a time in the calling
+    thread instead, e.g. for databases that only allow one writer.
+
+    Returns a dict of each name and its outcome: SUCCEEDED, FAILED or SKIPPED.
+    """
+    check_dependencies(dependencies)
+
+    results = {}
+    pending = dict(dependencies)
+    running = {}
+
+    if max_workers <= 1:
+        while pending:
+            for name, depends_on in sorted(pending.items()):
+                if any(results.get(d) in [FAILED, SKIPPED] for d in depends_on):
+                    results[name] = SKIPPED
+                elif all(results.get(d) == SUCCEEDED for d in depends_on):
+                    try:
+                        run(name)
+                        results[name] = SUCCEEDED
+                    except Exception:
+                        results[name] = FAILED
+                else:
+                    continue
+                del pending[name]
+                break
+        return results
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for name, depends_on in list(pending.items()):
+                if any(results.get(d) in [FAILED, SKIPPED] for d in depends_on):
+                    results[name] = SKIPPED
+                    del pending[name]
+                elif all(results.get(d) == SUCCEEDED for d in depends_on):
+                    running[executor.submit(run, name)] = name
+                    del pending[name]
+
+            if not running:
+                continue  # only skipped names were left
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = FAILED if future.exception() else SUCCEEDED
+
+    return results
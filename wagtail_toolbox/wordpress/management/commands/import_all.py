@@ -0,0 +1,193 @@
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+
+from wagtail_toolbox.wordpress.import_graph import (
+    FAILED,
+    SKIPPED,
+    get_model_dependencies,
+    run_in_dependency_order,
+)
+from wagtail_toolbox.wordpress.management.commands.importer import get_stages
+from wagtail_toolbox.wordpress.metrics import metrics
+from wagtail_toolbox.wordpress.models import WordpressEndpoint
+from wagtail_toolbox.wordpress.response_cache import ResponseCache
+from wagtail_toolbox.wordpress.snapshot import SnapshotClient, get_snapshot_path
+from wagtail_toolbox.wordpress.staging import StagingClient
+from wagtail_toolbox.wordpress.wordpress_import import STAGES, Importer
+
+
+class Command(BaseCommand):
+    help = """Import every WordPress endpoint configured on the Wordpress Host.
+
+    The endpoints are imported in the order of their foreign key and many to
+    many relationships. Endpoints that don't depend on each other, e.g.
+    users, categories and tags, are imported at the same time and each
+    endpoint starts as soon as the endpoints it depends on have finished.
+    If an endpoint fails the endpoints that depend on it are skipped.
+    SQLite only allows one writer so on SQLite the endpoints are imported
+    one at a time.
+
+    Example:
+        python manage.py import_all
+        python manage.py import_all --models WPCategory,WPTag,WPPost
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--models",
+            type=str,
+            help="Comma separated list of models to import. e.g. WPPost,WPPage",
+            default="",
+        )
+        parser.add_argument(
+            "--endpoints",
+            type=int,
+            help="The number of endpoints to import concurrently.",
+            default=getattr(settings, "WPI_CONCURRENT_ENDPOINTS", 4),
+        )
+        parser.add_argument(
+            "--cache",
+            action="store_true",
+            help="Revalidate responses against the on-disk response cache.",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only import records modified since the last import of each endpoint.",
+        )
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            default=None,
+            help="Parse each page item by item as it's downloaded to reduce memory use.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="The number of pages to import in each transaction.",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            help="The number of processes that clean the content and build the blocks.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Import every record, even if its source hasn't changed.",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Start again instead of resuming a failed import from its checkpoint.",
+        )
+        parser.add_argument(
+            "--from-staging",
+            action="store_true",
+            help="Rebuild the records from the staged raw json instead of the url.",
+        )
+        parser.add_argument(
+            "--stages",
+            type=str,
+            help=f"Comma separated list of the stages to run: {','.join(STAGES)}. "
+            "Without fetch the stages run over the existing records.",
+            default="",
+        )
+        parser.add_argument(
+            "--sync-deletions",
+            action="store_true",
+            help="Delete the records that have been deleted in WordPress.",
+        )
+        parser.add_argument(
+            "--from-snapshot",
+            type=str,
+            help="Import from a directory of snapshots instead of the endpoint urls.",
+        )
+
+    def handle(self, *args, **options):
+        metrics.reset()
+        options["stages"] = get_stages(options["stages"])
+        models = options["models"].split(",") if options["models"] else []
+
+        endpoints = WordpressEndpoint.objects.all()
+        if models:
+            endpoints = endpoints.filter(model__in=models)
+        endpoints = {endpoint.model: endpoint for endpoint in endpoints}
+
+        if not endpoints:
+            return self.stdout.write(self.style.ERROR("No endpoints to import."))
+
+        dependencies = get_model_dependencies(list(endpoints))
+        for model_name, depends_on in dependencies.items():
+            if depends_on:
+                self.stdout.write(
+                    f"{model_name} waits for {', '.join(sorted(depends_on))}"
+                )
+
+        cache = ResponseCache() if options["cache"] else None
+        max_workers = options["endpoints"]
+        if connection.vendor == "sqlite":
+            # concurrent write transactions fail with "database is locked"
+            max_workers = 1
+
+        def import_endpoint(model_name):
+            try:
+                self.import_endpoint(endpoints[model_name], cache, options)
+            except Exception as e:
+                self.stderr.write(f"Error importing {model_name}: {e}")
+                raise
+            finally:
+                if max_workers > 1:
+                    # each thread has its own database connection
+                    connection.close()
+
+        try:
+            results = run_in_dependency_order(
+                dependencies, import_endpoint, max_workers=max_workers
+            )
+        except ValueError as e:
+            raise CommandError(e)
+
+        self.stdout.write("Request metrics:")
+        for line in metrics.format_summary():
+            self.stdout.write(line)
+
+        for model_name, result in results.items():
+            style = self.style.ERROR if result in [FAILED, SKIPPED] else str
+            self.stdout.write(style(f"{model_name}: {result}"))
+
+        unfinished = [
+            model_name
+            for model_name, result in results.items()
+            if result in [FAILED, SKIPPED]
+        ]
+        if unfinished:
+            raise CommandError(f"Not imported: {', '.join(sorted(unfinished))}")
+
+    @staticmethod
+    def import_endpoint(endpoint, cache, options):
+        client = None
+        if options["from_snapshot"]:
+            client = SnapshotClient(
+                get_snapshot_path(options["from_snapshot"], endpoint.model)
+            )
+        elif options["from_staging"]:
+            client = StagingClient(endpoint.model)
+
+        importer = Importer(
+            url=endpoint.url,
+            model_name=endpoint.model,
+            cache=cache,
+            incremental=options["incremental"],
+            client=client,
+            stream=options["stream"],
+            batch_size=options["batch_size"],
+            processes=options["processes"],
+            force=options["force"] or options["from_staging"],
+            restart=options["restart"],
+            stage=not options["from_staging"],
+            sync_deletions=options["sync_deletions"],
+            stages=options["stages"],
+        )
+        importer.import_data()
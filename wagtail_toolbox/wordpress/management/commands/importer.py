@@ -1,6 +1,23 @@
-from django.core.management import BaseCommand
+import os
 
-from wagtail_toolbox.wordpress.wordpress_import import Importer
+from django.core.management import BaseCommand, CommandError
+
+from wagtail_toolbox.wordpress.metrics import metrics
+from wagtail_toolbox.wordpress.response_cache import ResponseCache
+from wagtail_toolbox.wordpress.snapshot import SnapshotClient, get_snapshot_path
+from wagtail_toolbox.wordpress.staging import StagingClient
+from wagtail_toolbox.wordpress.wordpress_import import STAGES, Importer
+
+
+def get_stages(value):
+    """Return the list of stages in a comma separated value, or None for all."""
+    stages = [stage for stage in value.split(",") if stage]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        raise CommandError(
+            f"Unknown stages: {', '.join(unknown)}. Choose from {', '.join(STAGES)}"
+        )
+    return stages or None
 
 
 class Command(BaseCommand):
@@ -18,10 +35,112 @@ class Command(BaseCommand):
             type=str,
             help="The model to import data to.",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="The number of pages to fetch concurrently.",
+        )
+        parser.add_argument(
+            "--prefetch",
+            type=int,
+            help="The number of extra pages to fetch ahead of the page being imported.",
+        )
+        parser.add_argument(
+            "--cache",
+            action="store_true",
+            help="Revalidate responses against the on-disk response cache.",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only import records modified since the last import of the endpoint.",
+        )
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            default=None,
+            help="Parse each page item by item as it's downloaded to reduce memory use.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="The number of pages to import in each transaction.",
+        )
+        parser.add_argument(
+            "--start-page",
+            type=int,
+            help="The page to resume a failed import from, defaults to its checkpoint.",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            help="The number of processes that clean the content and build the blocks.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Import every record, even if its source hasn't changed.",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Start again instead of resuming a failed import from its checkpoint.",
+        )
+        parser.add_argument(
+            "--from-staging",
+            action="store_true",
+            help="Rebuild the records from the staged raw json instead of the url.",
+        )
+        parser.add_argument(
+            "--stages",
+            type=str,
+            help=f"Comma separated list of the stages to run: {','.join(STAGES)}. "
+            "Without fetch the stages run over the existing records.",
+            default="",
+        )
+        parser.add_argument(
+            "--sync-deletions",
+            action="store_true",
+            help="Delete the records that have been deleted in WordPress.",
+        )
+        parser.add_argument(
+            "--from-snapshot",
+            type=str,
+            help="Import from a snapshot file, or directory of snapshots, instead of the url.",
+        )
 
     def handle(self, *args, **options):
+        metrics.reset()
+
+        client = None
+        if options["from_snapshot"]:
+            path = options["from_snapshot"]
+            if os.path.isdir(path):
+                path = get_snapshot_path(path, options["model"])
+            client = SnapshotClient(path)
+        elif options["from_staging"]:
+            client = StagingClient(options["model"])
+
         importer = Importer(
             url=options["url"],
             model_name=options["model"],
+            max_workers=options["workers"],
+            prefetch=options["prefetch"],
+            cache=ResponseCache() if options["cache"] else None,
+            incremental=options["incremental"],
+            client=client,
+            stream=options["stream"],
+            batch_size=options["batch_size"],
+            processes=options["processes"],
+            force=options["force"] or options["from_staging"],
+            restart=options["restart"],
+            stage=not options["from_staging"],
+            sync_deletions=options["sync_deletions"],
+            stages=get_stages(options["stages"]),
+            start_page=options["start_page"],
         )
         importer.import_data()
+
+        self.stdout.write("Request metrics:")
+        for line in metrics.format_summary():
+            self.stdout.write(line)
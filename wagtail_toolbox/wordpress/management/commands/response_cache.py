@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from wagtail_toolbox.wordpress.response_cache import MediaCache, ResponseCache
+
+
+class Command(BaseCommand):
+    help = """Inspect or clear the on-disk caches of WordPress API responses and media.
+
+    Example:
+        Show the directory, number of responses and size of each cache:
+            python manage.py response_cache
+
+        Remove every cached response:
+            python manage.py response_cache --clear
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Remove every cached response.",
+        )
+
+    def handle(self, *args, **options):
+        caches = {"API responses": ResponseCache(), "Media": MediaCache()}
+
+        if options["clear"]:
+            for cache in caches.values():
+                cache.clear()
+            return self.stdout.write(self.style.SUCCESS("Cleared the response cache."))
+
+        for name, cache in caches.items():
+            self.stdout.write(f"{name}:")
+            for key, value in cache.info().items():
+                self.stdout.write(f"  {key}: {value}")
@@ -0,0 +1,60 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from wagtail_toolbox.wordpress.api_client import Client
+from wagtail_toolbox.wordpress.models import WordpressEndpoint
+from wagtail_toolbox.wordpress.snapshot import get_snapshot_path, write_snapshot
+
+
+class Command(BaseCommand):
+    help = """Save every configured WordPress endpoint to a snapshot on disk.
+
+    Each endpoint is saved to [directory]/[model].jsonl.gz, one item per line.
+    The importer can then read the snapshot instead of the network.
+
+    Example:
+        Save a snapshot of every endpoint:
+            python manage.py snapshot snapshots
+
+        Import posts from the snapshot:
+            python manage.py importer http://localhost:8888/wp-json/wp/v2/posts WPPost --from-snapshot snapshots
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "directory",
+            type=str,
+            nargs="?",
+            help="The directory to save the snapshots to.",
+            default=getattr(settings, "WPI_SNAPSHOT_DIR", "snapshots"),
+        )
+        parser.add_argument(
+            "--models",
+            type=str,
+            help="Comma separated list of models to save. e.g. WPPost,WPPage",
+            default="",
+        )
+
+    def handle(self, *args, **options):
+        os.makedirs(options["directory"], exist_ok=True)
+        models = options["models"].split(",") if options["models"] else []
+
+        endpoints = WordpressEndpoint.objects.all()
+        if models:
+            endpoints = endpoints.filter(model__in=models)
+
+        if not endpoints:
+            return self.stdout.write(self.style.ERROR("No endpoints to save."))
+
+        for endpoint in endpoints:
+            path = get_snapshot_path(options["directory"], endpoint.model)
+            client = Client(
+                endpoint.url,
+                params={"per_page": getattr(settings, "WPI_PER_PAGE", 100)},
+            )
+            count = write_snapshot(client, path, endpoint.model)
+            self.stdout.write(f"Saved {count} {endpoint.model} to {path}")
+
+        self.stdout.write(self.style.SUCCESS("Done!"))
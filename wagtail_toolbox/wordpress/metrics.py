@@ -0,0 +1,126 @@
+import math
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+RequestRecord = namedtuple(
+    "RequestRecord",
+    ["url", "status_code", "latency", "size", "retries", "decode_time"],
+)
+
+
+def percentile(values, percent):
+    """Return the nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class RequestMetrics:
+    """Record metrics for every request and summarise them per endpoint.
+
+    For each request the latency, bytes transferred, status code, number of
+    retries and the time spent decoding JSON are recorded against an endpoint.
+    The number of items processed can be recorded too so the summary can show
+    the throughput of the endpoint from its first request to its last event.
+
+    It's safe to record from several threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = defaultdict(list)
+            self.items = defaultdict(int)
+            self.started = {}
+            self.finished = {}
+
+    def _mark(self, endpoint, started):
+        now = time.perf_counter()
+        self.started[endpoint] = min(self.started.get(endpoint, started), started)
+        self.finished[endpoint] = max(self.finished.get(endpoint, now), now)
+
+    def record(
+        self,
+        endpoint,
+        url,
+        status_code,
+        latency,
+        size,
+        retries=0,
+        decode_time=0.0,
+    ):
+        """Record a request to the url of an endpoint. Times are in seconds."""
+        record = RequestRecord(url, status_code, latency, size, retries, decode_time)
+        with self.lock:
+            self.requests[endpoint].append(record)
+            self._mark(endpoint, time.perf_counter() - latency - decode_time)
+
+    def record_items(self, endpoint, count):
+        """Record that count items of an endpoint have been processed."""
+        with self.lock:
+            self.items[endpoint] += count
+            self._mark(endpoint, time.perf_counter())
+
+    def summary(self):
+        """Return a dict of statistics for each endpoint."""
+        with self.lock:
+            endpoints = list(self.started)
+            summary = {}
+            for endpoint in endpoints:
+                records = self.requests[endpoint]
+                latencies = [r.latency for r in records]
+                size = sum(r.size for r in records)
+                elapsed = self.finished[endpoint] - self.started[endpoint]
+                status_codes = defaultdict(int)
+                for record in records:
+                    status_codes[record.status_code] += 1
+
+                summary[endpoint] = {
+                    "requests": len(records),
+                    "retries": sum(r.retries for r in records),
+                    "status_codes": dict(status_codes),
+                    "latency_p50": percentile(latencies, 50),
+                    "latency_p95": percentile(latencies, 95),
+                    "latency_p99": percentile(latencies, 99),
+                    "decode_time": sum(r.decode_time for r in records),
+                    "bytes": size,
+                    "items": self.items[endpoint],
+                    "elapsed": elapsed,
+                    "items_per_second": self.items[endpoint] / elapsed
+                    if elapsed
+                    else 0,
+                    "mb_per_second": size / 1_000_000 / elapsed if elapsed else 0,
+                }
+            return summary
+
+    def format_summary(self):
+        """Return the summary as lines of text."""
+        lines = []
+        for endpoint, stats in self.summary().items():
+            status_codes = ", ".join(
+                f"{code}: {count}"
+                for code, count in sorted(stats["status_codes"].items())
+            )
+            lines += [
+                f"{endpoint}",
+                f"  requests: {stats['requests']} ({stats['retries']} retries) {status_codes}",
+                f"  latency: p50 {stats['latency_p50'] * 1000:.0f}ms"
+                f" p95 {stats['latency_p95'] * 1000:.0f}ms"
+                f" p99 {stats['latency_p99'] * 1000:.0f}ms",
+                f"  json decoding: {stats['decode_time']:.2f}s",
+                f"  transferred: {stats['bytes'] / 1_000_000:.2f}MB"
+                f" in {stats['elapsed']:.2f}s",
+                f"  throughput: {stats['items_per_second']:.1f} items/s"
+                f" {stats['mb_per_second']:.2f}MB/s",
+            ]
+        return lines
+
+
+# Shared by the API clients and fetch_url.
+metrics = RequestMetrics()
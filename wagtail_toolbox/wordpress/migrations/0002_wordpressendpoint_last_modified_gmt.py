@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-18 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("wordpress", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="wordpressendpoint",
+            name="last_modified_gmt",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Clear this to import every record on the next incremental import.",
+                null=True,
+            ),
+        ),
+    ]
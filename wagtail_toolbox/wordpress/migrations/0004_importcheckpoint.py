@@ -0,0 +1,52 @@
+# Generated by Django 4.1.13 on 2026-10-18 10:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("wordpress", "0003_wordpressmodel_wp_source_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("model", models.CharField(max_length=255, unique=True)),
+                ("url", models.CharField(max_length=255)),
+                (
+                    "last_page",
+                    models.IntegerField(
+                        default=0,
+                        help_text="The last page committed in the fetch phase.",
+                    ),
+                ),
+                (
+                    "phase",
+                    models.CharField(
+                        choices=[
+                            ("fetch", "Fetch"),
+                            ("fk", "Foreign keys"),
+                            ("m2m", "Many to many keys"),
+                            ("complete", "Complete"),
+                        ],
+                        default="fetch",
+                        max_length=20,
+                    ),
+                ),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["model"],
+            },
+        ),
+    ]
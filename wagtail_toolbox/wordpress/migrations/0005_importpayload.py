@@ -0,0 +1,39 @@
+# Generated by Django 4.1.13 on 2026-10-18 10:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("wordpress", "0004_importcheckpoint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportPayload",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("model", models.CharField(max_length=255)),
+                ("wp_id", models.IntegerField(verbose_name="Wordpress ID")),
+                ("payload", models.BinaryField()),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["model", "wp_id"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="importpayload",
+            constraint=models.UniqueConstraint(
+                fields=("model", "wp_id"), name="unique_import_payload"
+            ),
+        ),
+    ]
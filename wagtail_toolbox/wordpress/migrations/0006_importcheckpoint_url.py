@@ -0,0 +1,19 @@
+# Generated by Django 4.1.13 on 2026-10-18 10:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("wordpress", "0005_importpayload"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="importcheckpoint",
+            name="url",
+            field=models.TextField(
+                help_text="The url of the first page with its query parameters."
+            ),
+        ),
+    ]
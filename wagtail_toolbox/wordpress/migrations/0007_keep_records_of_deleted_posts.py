@@ -0,0 +1,43 @@
+# Generated by Django 4.1.13 on 2026-10-18 11:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("wordpress", "0006_importcheckpoint_url"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="wpcomment",
+            name="parent",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="wordpress.wpcomment",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="wpcomment",
+            name="post",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="wordpress.wppost",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="wpmedia",
+            name="post",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="wordpress.wppost",
+            ),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from .config import (  # noqa F401; WordpressSettings,
+    ImportCheckpoint,
+    ImportPayload,
     StreamBlockSignatureBlocks,
     WordpressEndpoint,
     WordpressHost,
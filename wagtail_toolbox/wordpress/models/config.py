@@ -35,15 +35,87 @@ class WordpressEndpoint(Orderable):
     name = models.CharField(max_length=255, unique=True)
     url = models.CharField(max_length=255, unique=True)
     model = models.CharField(max_length=255, unique=True)
+    # The highest modified_gmt imported from this endpoint.
+    # Incremental imports only request records modified after it.
+    last_modified_gmt = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text="Clear this to import every record on the next incremental import.",
+    )
     setting = ParentalKey("WordpressHost", related_name="wordpress_endpoints")
 
     panels = [
         FieldPanel("name"),
         FieldPanel("url"),
         FieldPanel("model"),
+        FieldPanel("last_modified_gmt"),
     ]
 
 
+class ImportCheckpoint(models.Model):
+    """The progress of the import of a model, so a failed import can be resumed.
+
+    The pages are imported in the fetch phase, cleaning the content and
+    building the blocks as they go. The foreign keys and many to many keys
+    are then resolved in their own phases.
+    """
+
+    PHASE_FETCH = "fetch"
+    PHASE_FOREIGN_KEYS = "fk"
+    PHASE_MANY_TO_MANY = "m2m"
+    PHASE_COMPLETE = "complete"
+    PHASES = [PHASE_FETCH, PHASE_FOREIGN_KEYS, PHASE_MANY_TO_MANY, PHASE_COMPLETE]
+
+    model = models.CharField(max_length=255, unique=True)
+    url = models.TextField(
+        help_text="The url of the first page with its query parameters."
+    )
+    last_page = models.IntegerField(
+        default=0, help_text="The last page committed in the fetch phase."
+    )
+    phase = models.CharField(
+        max_length=20,
+        default=PHASE_FETCH,
+        choices=[
+            (PHASE_FETCH, "Fetch"),
+            (PHASE_FOREIGN_KEYS, "Foreign keys"),
+            (PHASE_MANY_TO_MANY, "Many to many keys"),
+            (PHASE_COMPLETE, "Complete"),
+        ],
+    )
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.model} {self.phase} page {self.last_page}"
+
+    class Meta:
+        ordering = ["model"]
+
+
+class ImportPayload(models.Model):
+    """The raw json of an imported item, compressed with zlib.
+
+    The importer can rebuild the records of a model from these instead of
+    downloading them again, see StagingClient.
+    """
+
+    model = models.CharField(max_length=255)
+    wp_id = models.IntegerField(verbose_name="Wordpress ID")
+    payload = models.BinaryField()
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.model} {self.wp_id}"
+
+    class Meta:
+        ordering = ["model", "wp_id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["model", "wp_id"], name="unique_import_payload"
+            )
+        ]
+
+
 @register_setting(icon="cogs")
 class WordpressHost(ClusterableModel, BaseSiteSetting):
     """Settings for the Wordpress importer."""
@@ -1,3 +1,5 @@
+import re
+
 from bs4 import BeautifulSoup as bs4
 from django.conf import settings
 from django.db import models
@@ -25,6 +27,10 @@ class WordpressModel(models.Model):
     wagtail_model = models.JSONField(blank=True, null=True)
     wp_cleaned_content = models.TextField(blank=True, null=True)
     wp_block_content = models.JSONField(blank=True, null=True)
+    # A hash of the source json, the importer skips records that haven't changed
+    wp_source_hash = models.CharField(
+        max_length=64, blank=True, null=True, editable=False
+    )
 
     class Meta:
         abstract = True
@@ -59,6 +65,33 @@ class WordpressModel(models.Model):
 
         return import_fields
 
+    def include_fields_source_request(self):
+        """Top level keys of the source data to request with the `_fields` parameter.
+
+        Only the keys the import reads are requested: the id, the model fields,
+        the root of each process_fields expression, the foreign and many to many
+        keys and the UNIQUE_FIELDS. Everything else, e.g. _links, is left out.
+        """
+        base_fields = [f.name for f in WordpressModel._meta.fields]
+        source_fields = ["id"] + [
+            f.name
+            for f in self._meta.get_fields()
+            if not f.auto_created and f.name not in base_fields
+        ]
+
+        for field in self.process_fields():
+            for _, value in field.items():
+                # e.g. "title.rendered" is requested as "title"
+                source_fields.append(re.split(r"[.\[]", value)[0])
+
+        for field in self.process_foreign_keys() + self.process_many_to_many_keys():
+            for key, _ in field.items():
+                source_fields.append(key)
+
+        source_fields += getattr(self, "UNIQUE_FIELDS", [])
+
+        return list(dict.fromkeys(source_fields))  # unique, in order
+
     @staticmethod
     def clean_content_html(html_content, clean_tags=None):
         """Clean the content.
@@ -376,13 +409,13 @@ class WPComment(WordpressModel):
     author_avatar_urls = models.URLField(blank=True, null=True)
     post = models.ForeignKey(
         "wordpress.WPPost",
-        on_delete=models.CASCADE,
+        on_delete=models.SET_NULL,
         blank=True,
         null=True,
     )
     parent = models.ForeignKey(
         "wordpress.WPComment",
-        on_delete=models.CASCADE,
+        on_delete=models.SET_NULL,
         blank=True,
         null=True,
     )
@@ -452,7 +485,7 @@ class WPMedia(WordpressModel):
     )
     post = models.ForeignKey(
         "wordpress.WPPost",
-        on_delete=models.CASCADE,
+        on_delete=models.SET_NULL,
         blank=True,
         null=True,
     )
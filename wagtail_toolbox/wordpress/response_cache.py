@@ -0,0 +1,258 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from urllib.parse import urlencode
+
+import requests
+from django.conf import settings
+from requests.structures import CaseInsensitiveDict
+
+# The body is stored decoded so these no longer describe it.
+EXCLUDED_HEADERS = ["content-encoding", "content-length", "transfer-encoding"]
+
+# Eviction removes responses until the cache is this fraction of max_size.
+EVICT_TO = 0.9
+
+
+class ResponseCache:
+    """An on-disk cache of HTTP responses.
+
+    A response is only cached if it has an ETag or a Last-Modified header.
+    Each later request for the same url and params is sent with If-None-Match
+    and/or If-Modified-Since and if the host answers 304 Not Modified the
+    cached body is used instead of downloading it again.
+
+    Each response is kept as two files named after a hash of the url and params:
+    - [key].json: the url, status code, headers and validators.
+    - [key].body: the response body.
+
+    When the bodies take up more than max_size bytes the least recently
+    used responses are removed. The total size is scanned once and then kept
+    up to date as responses are stored, so the directory is only scanned
+    again when responses are evicted.
+    """
+
+    def __init__(self, directory=None, max_size=None):
+        self.directory = directory or getattr(
+            settings,
+            "WPI_CACHE_DIR",
+            os.path.join(tempfile.gettempdir(), "wagtail_toolbox", "responses"),
+        )
+        self.max_size = max_size or getattr(
+            settings, "WPI_CACHE_MAX_SIZE", 512 * 1024 * 1024
+        )
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.size = None  # the total size of the bodies, see get_size
+
+    @staticmethod
+    def get_key(url, params=None):
+        """Return the cache key for the url and params."""
+        if params:
+            url = f"{url}?{urlencode(sorted(params.items()))}"
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def get_paths(self, key):
+        """Return the paths of the meta and body files of a key."""
+        path = os.path.join(self.directory, key)
+        return f"{path}.json", f"{path}.body"
+
+    def get(self, url, params=None, session=None, **kwargs):
+        """Get the url, revalidating a cached response if there is one.
+
+        Takes the same keyword arguments as requests.get() and returns a
+        requests.Response either way.
+        """
+        session = session or requests
+        key = self.get_key(url, params)
+        meta = self.load_meta(key)
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if meta:
+            if meta["etag"]:
+                headers["If-None-Match"] = meta["etag"]
+            if meta["last_modified"]:
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = session.get(url, params=params, headers=headers, **kwargs)
+
+        if response.status_code == 304 and meta:
+            cached_response = self.load_response(key, meta)
+            if cached_response is not None:
+                return cached_response
+            # the body was removed after the meta was read, by an evict()
+            # or clear() elsewhere, so drop the meta and ask for it whole
+            self.remove(key)
+            headers.pop("If-None-Match", None)
+            headers.pop("If-Modified-Since", None)
+            response = session.get(url, params=params, headers=headers, **kwargs)
+
+        if response.status_code == 200 and (
+            "ETag" in response.headers or "Last-Modified" in response.headers
+        ):
+            with self.lock:
+                size = self.get_size()  # scanned before the body is added
+                self.size = size + self.store(key, response)
+                if self.size > self.max_size:
+                    self.evict()
+
+        return response
+
+    def load_meta(self, key):
+        meta_path, _ = self.get_paths(key)
+        try:
+            with open(meta_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def load_response(self, key, meta):
+        """Build a response from the cached meta and body of a key."""
+        _, body_path = self.get_paths(key)
+        try:
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+
+        os.utime(body_path)  # mark as recently used
+
+        response = requests.Response()
+        response.url = meta["url"]
+        response.status_code = meta["status_code"]
+        response.headers = CaseInsensitiveDict(meta["headers"])
+        response._content = body
+        return response
+
+    def store(self, key, response):
+        """Store the response and return the change in the size of the cache."""
+        meta_path, body_path = self.get_paths(key)
+        try:
+            old_size = os.path.getsize(body_path)
+        except FileNotFoundError:
+            old_size = 0
+
+        meta = {
+            "url": response.url,
+            "status_code": response.status_code,
+            "headers": {
+                k: v
+                for k, v in response.headers.items()
+                if k.lower() not in EXCLUDED_HEADERS
+            },
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+
+        # write to a temporary file first so a concurrent reader
+        # never sees a half written body
+        for path, mode, content in [
+            (body_path, "wb", response.content),
+            (meta_path, "w", json.dumps(meta)),
+        ]:
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, mode) as f:
+                f.write(content)
+            os.replace(temp_path, path)
+
+        return len(response.content) - old_size
+
+    def get_entries(self):
+        """Return a list of (last used, size, key) for each cached body."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".body"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.name[:-5]))
+        return entries
+
+    def get_size(self):
+        """Return the total size of the bodies, scanning the directory once."""
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self.get_entries())
+        return self.size
+
+    def evict(self):
+        """Remove the least recently used responses until under max_size.
+
+        The cache is shrunk to EVICT_TO of max_size so the next responses
+        stored don't each need another scan of the directory.
+        """
+        entries = self.get_entries()
+        total_size = sum(size for _, size, _ in entries)
+
+        for _, size, key in sorted(entries):
+            if total_size <= self.max_size * EVICT_TO:
+                break
+            self.remove(key)
+            total_size -= size
+        self.size = total_size
+
+    def remove(self, key):
+        for path in self.get_paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def info(self):
+        """Return the directory, number of responses and size of the cache."""
+        entries = self.get_entries()
+        return {
+            "directory": self.directory,
+            "responses": len(entries),
+            "size": sum(size for _, size, _ in entries),
+            "max_size": self.max_size,
+        }
+
+    def clear(self):
+        """Remove every cached response."""
+        for _, _, key in self.get_entries():
+            self.remove(key)
+        self.size = 0
+
+
+def get_response_cache():
+    """Return a ResponseCache if WPI_CACHE_ENABLED is set, otherwise None."""
+    if getattr(settings, "WPI_CACHE_ENABLED", False):
+        return ResponseCache()
+    return None
+
+
+class MediaCache(ResponseCache):
+    """The response cache for images and documents fetched by fetch_url.
+
+    It's kept apart from the API pages, in WPI_MEDIA_CACHE_DIR and limited to
+    WPI_MEDIA_CACHE_MAX_SIZE bytes, so large files don't push the pages out.
+    """
+
+    def __init__(self, directory=None, max_size=None):
+        super().__init__(
+            directory=directory
+            or getattr(
+                settings,
+                "WPI_MEDIA_CACHE_DIR",
+                os.path.join(tempfile.gettempdir(), "wagtail_toolbox", "media"),
+            ),
+            max_size=max_size
+            or getattr(settings, "WPI_MEDIA_CACHE_MAX_SIZE", 1024 * 1024 * 1024),
+        )
+
+
+_media_caches = {}
+
+
+def get_media_cache():
+    """Return a MediaCache if WPI_CACHE_ENABLED is set, otherwise None.
+
+    The same MediaCache is returned for each directory so its size is only
+    scanned once, not on every fetch."""
+    if not getattr(settings, "WPI_CACHE_ENABLED", False):
+        return None
+    cache = MediaCache()
+    return _media_caches.setdefault((cache.directory, cache.max_size), cache)
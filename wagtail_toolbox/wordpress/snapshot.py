@@ -0,0 +1,94 @@
+import gzip
+import json
+import os
+from itertools import islice
+
+import requests
+from django.conf import settings
+
+from wagtail_toolbox.wordpress.api_client import BaseClient
+
+# The pagination headers kept in the snapshot.
+SNAPSHOT_HEADERS = ["X-WP-Total", "X-WP-TotalPages"]
+
+
+def get_snapshot_path(directory, model_name):
+    """Return the path of the snapshot of a model in the directory."""
+    return os.path.join(directory, f"{model_name}.jsonl.gz")
+
+
+def write_snapshot(client, path, model_name):
+    """Write every item of the client's endpoint to a gzipped JSON Lines file.
+
+    The first line holds the url, params and pagination headers of the
+    endpoint, each following line holds one item.
+
+    Returns:
+        int: The number of items written.
+    """
+    header = {
+        "url": client.url,
+        "model": model_name,
+        "params": client.params,
+        "headers": {
+            key: client.response.headers[key]
+            for key in SNAPSHOT_HEADERS
+            if key in client.response.headers
+        },
+    }
+
+    count = 0
+    temp_path = f"{path}.tmp"
+    with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+        f.write(json.dumps(header) + "\n")
+        if client.is_paged:
+            for item in client.iter_items():
+                f.write(json.dumps(item) + "\n")
+                count += 1
+    os.replace(temp_path, path)  # don't leave a partial snapshot behind
+
+    return count
+
+
+class SnapshotClient(BaseClient):
+    """Replay a snapshot written by write_snapshot in place of a Client.
+
+    It has the same surface as the Client, the pages have the same urls and
+    items as when the snapshot was taken but are read from disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+
+        self.url = header["url"]
+        self.params = header["params"]
+        self.per_page = int(
+            self.params.get("per_page", getattr(settings, "WPI_PER_PAGE", 10))
+        )
+        self.response = requests.Response()
+        self.response.headers.update(header["headers"])
+
+    def fetch_pages(self, urls=None, max_workers=None, prefetch=None):
+        """Yield a (url, json) tuple for each page of the snapshot in order.
+
+        If urls are given only those pages are yielded.
+        """
+        if not self.is_paged:
+            return
+
+        urls = None if urls is None else set(urls)
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            f.readline()  # skip the header
+            items = (json.loads(line) for line in f)
+            for url in self.iter_paged_endpoints():
+                page = list(islice(items, self.per_page))
+                if urls is None or url in urls:
+                    yield url, page
+
+    def iter_items(self, urls=None, max_workers=None, prefetch=None):
+        """Yield each item of the snapshot in order."""
+        for _, json_response in self.fetch_pages():
+            yield from json_response
@@ -1,227 +1,980 @@
+import datetime
+import hashlib
+import json
+import multiprocessing
 import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice, repeat
+from urllib.parse import urlencode
 
 import jmespath
 from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
+from wagtail_toolbox.wordpress import content_worker
 from wagtail_toolbox.wordpress.api_client import Client
 from wagtail_toolbox.wordpress.block_builder import WagtailBlockBuilder
+from wagtail_toolbox.wordpress.bulk import bulk_upsert
+from wagtail_toolbox.wordpress.metrics import metrics
+from wagtail_toolbox.wordpress.models import ImportCheckpoint, WordpressEndpoint
+from wagtail_toolbox.wordpress.staging import stage_items
+
+# the stages of an import, in the order they run
+STAGE_FETCH = "fetch"
+STAGE_RELATIONS = "relations"
+STAGE_CLEAN = "clean"
+STAGE_BLOCKS = "blocks"
+STAGES = [STAGE_FETCH, STAGE_RELATIONS, STAGE_CLEAN, STAGE_BLOCKS]
+
+ExtractionPlan = namedtuple(
+    "ExtractionPlan",
+    ["import_fields", "process_fields", "foreign_keys", "many_to_many_keys"],
+)
+
+
+@lru_cache(maxsize=None)
+def get_extraction_plan(model):
+    """Return how the items of a model are extracted, built once per process.
+
+    - import_fields: the fields copied from the item as they are.
+    - process_fields: (field, compiled jmespath expression) for nested values.
+    - foreign_keys and many_to_many_keys: (key, related model name, field),
+      a related model of "self" is the model itself.
+    """
+
+    def get_keys(process_keys):
+        return [
+            (
+                key,
+                model.__name__
+                if value["model"] == "self"
+                else apps.get_model("wordpress", value["model"]).__name__,
+                value["field"],
+            )
+            for field in process_keys()
+            for key, value in field.items()
+        ]
+
+    return ExtractionPlan(
+        import_fields=tuple(model.include_fields_initial_import(model)),
+        process_fields=tuple(
+            (key, jmespath.compile(value))
+            for field in model.process_fields()
+            for key, value in field.items()
+        ),
+        foreign_keys=tuple(get_keys(model.process_foreign_keys)),
+        many_to_many_keys=tuple(get_keys(model.process_many_to_many_keys)),
+    )
+
+
+def build_content(model_name, data, stream_block_signatures=None, stages=None):
+    """Return the cleaned content and block content fields of an item's data.
+
+    The process_clean_fields of the model are cleaned and then built into
+    blocks with its process_block_fields. It only uses its arguments, not the
+    database, so the importer can run it in a pool of processes. In the pool
+    the signatures default to the ones given to init_content_worker.
+
+    Pass stages to only clean the content, or only build the blocks from the
+    cleaned content in data.
+    """
+    model = apps.get_model("wordpress", model_name)
+    stages = stages or [STAGE_CLEAN, STAGE_BLOCKS]
+    stream_block_signatures = (
+        stream_block_signatures or content_worker.stream_block_signatures
+    )
+    content_fields = {}
+
+    if STAGE_CLEAN in stages:
+        for cleaned_field in model.process_clean_fields():
+            for source_field, destination_field in cleaned_field.items():
+                content_fields[destination_field] = model.clean_content_html(
+                    data[source_field]
+                )
+
+    if STAGE_BLOCKS in stages and model.process_clean_fields():
+        block_builder = WagtailBlockBuilder(
+            stream_block_signatures=stream_block_signatures
+        )
+        for operation in model.process_block_fields():
+            for source_field, destination_field in operation.items():
+                content_fields[destination_field] = block_builder.build(
+                    content_fields.get(source_field, data.get(source_field))
+                )
+
+    return content_fields
 
 
 class Importer:
-    def __init__(self, url, model_name):
-        self.client = Client(url)
-        self.model = apps.get_model("wordpress", model_name)
-        self.fk_objects = []
-        self.mtm_objects = []
-        self.cleaned_objects = []
-        self.import_fields = self.model.include_fields_initial_import(self.model)
+    def __init__(
+        self,
+        url,
+        model_name,
+        max_workers=None,
+        prefetch=None,
+        cache=None,
+        incremental=False,
+        client=None,
+        stream=None,
+        batch_size=None,
+        start_page=None,
+        processes=None,
+        force=False,
+        restart=False,
+        stage=True,
+        stages=None,
+        sync_deletions=False,
+    ):
+        """Pass a client, e.g. a SnapshotClient, to read the data from it
+        instead of fetching the url.
 
-    def import_data(self):
-        """Import data from wordpress api for each endpoint"""
+        batch_size is the number of pages imported per transaction. A failed
+        import is resumed from its checkpoint, pass start_page to resume from
+        another page or restart to start again.
 
-        sys.stdout.write("Importing data...\n")
+        With more than one process the content of each page is cleaned and
+        built into blocks by a pool of that many processes.
+
+        Records whose source json hasn't changed since they were imported are
+        skipped, pass force to import them anyway.
+
+        The raw json of each imported item is staged in ImportPayload unless
+        stage is False, e.g. when the items are read from the staging table.
 
-        for endpoint in self.client.paged_endpoints:
-            sys.stdout.write(f"Importing {self.model.__name__} {endpoint}...\n")
-            json_response = self.client.get(endpoint)
-
-            for item in json_response:
-                # Some wordpress records have duplicate, essentially unique fields
-                # e.g. Tags has name and slug field but names can be the same
-                # That doesn't work well with taggit default model, but why would you have 2 the same anyway?
-                if hasattr(self.model, "UNIQUE_FIELDS"):
-                    qs = self.model.objects.filter(
-                        **{field: item[field] for field in self.model.UNIQUE_FIELDS}
+        Pass a list of STAGES to only run those. Without the fetch stage the
+        other stages run over every existing record, e.g. to rebuild the
+        blocks after changing the StreamBlockSignatureBlocks.
+
+        With sync_deletions the records that are no longer in WordPress are
+        deleted once the stages have run, see sync_deletions.
+        """
+        self.url = url
+        self.model = apps.get_model("wordpress", model_name)
+        self.endpoint = WordpressEndpoint.objects.filter(model=model_name).first()
+        self.incremental = incremental
+        self.last_modified_gmt = None
+        self.batch_size = batch_size or getattr(settings, "WPI_IMPORT_BATCH_PAGES", 1)
+        self.start_page = start_page
+        self.restart = restart
+        self.created = self.updated = self.skipped = 0
+        self.resumed = False
+        self.checkpoint = None
+        self.processes = processes or getattr(settings, "WPI_IMPORT_PROCESSES", 1)
+        self.executor = None
+        self.stream_block_signatures = None
+        self.force = force
+        self.stage = stage
+        self.sync = sync_deletions
+        self.stages = [stage for stage in STAGES if stage in (stages or STAGES)]
+        # the content is built while fetching unless only part of it is wanted
+        self.build_content_on_fetch = (
+            STAGE_CLEAN in self.stages and STAGE_BLOCKS in self.stages
+        )
+        # records are only skipped as unchanged once they're fully imported,
+        # so their source hash isn't saved if a stage they need isn't run
+        self.save_source_hash = STAGE_RELATIONS in self.stages and (
+            self.build_content_on_fetch or not self.model.process_clean_fields()
+        )
+        self.hash_salt = ""
+        self.last_committed_page = None
+        # the other stages only read the existing records
+        if client is None and STAGE_FETCH in self.stages:
+            client = Client(
+                url,
+                max_workers=max_workers,
+                prefetch=prefetch,
+                params=self.get_request_params(),
+                cache=cache,
+                stream=stream,
+            )
+        self.client = client
+        # only the wp_ids are kept, the deferred passes read the rest back
+        self.imported_wp_ids = []
+        # {wp_id: source hash} of the records saved before their relations
+        # were resolved, and the pks of the records that couldn't be
+        self.pending_source_hashes = {}
+        self.unresolved_pks = set()
+        self.unique_keys = None
+        # the fields written by save_objects, in order
+        self.update_fields = dict.fromkeys(
+            ["wp_foreign_keys", "wp_many_to_many_keys", "wp_source_hash"]
+        )
+        self.plan = get_extraction_plan(self.model)
+
+    def get_request_params(self):
+        """Request the most items per page and only the fields the import uses.
+
+        If WPI_STAGE_ALL_FIELDS is set every field is requested when the items
+        are staged, so the records can be rebuilt with fields the import
+        doesn't use yet.
+
+        For incremental imports only request the records modified after
+        the last import of the endpoint, oldest first.
+        """
+        params = {"per_page": getattr(settings, "WPI_PER_PAGE", 100)}
+        if not (self.stage and getattr(settings, "WPI_STAGE_ALL_FIELDS", False)):
+            params["_fields"] = ",".join(
+                self.model.include_fields_source_request(self.model)
+            )
+
+        if self.incremental:
+            if not self.is_incremental_model():
+                sys.stdout.write(
+                    f"{self.model.__name__} has no modified_gmt, importing everything.\n"
+                )
+            elif not self.endpoint or not self.endpoint.last_modified_gmt:
+                sys.stdout.write(
+                    f"{self.model.__name__} hasn't been imported yet, importing everything.\n"
+                )
+            else:
+                last_modified_gmt = self.endpoint.last_modified_gmt
+                if timezone.is_aware(last_modified_gmt):
+                    last_modified_gmt = timezone.make_naive(
+                        last_modified_gmt, datetime.timezone.utc
                     )
-                    if qs.exists():
-                        continue  # bail out of this loop,
-                        # TODO: the side effect is the object won't be updated only created
-
-                # rename the id field to wp_id
-                item["wp_id"] = item.pop("id")
-                data = {
-                    field: item[field] for field in self.import_fields if field in item
-                }
-
-                # some data is nested in the json response
-                # so use jmespath to get to it and update the value
-                if hasattr(self.model, "process_fields"):
-                    for field in self.model.process_fields():
-                        for key, value in field.items():
-                            data.update({key: jmespath.search(value, item)})
-
-                # create or update the model with data we have so far
-                obj, created = self.model.objects.update_or_create(
-                    wp_id=item["wp_id"], defaults=data
+                sys.stdout.write(
+                    f"Importing {self.model.__name__} modified after {last_modified_gmt}\n"
+                )
+                params.update(
+                    {
+                        "modified_after": f"{last_modified_gmt.isoformat()}Z",
+                        "orderby": "modified",
+                        "order": "asc",
+                    }
                 )
 
-                sys.stdout.write(f"Created {obj}\n" if created else f"Updated {obj}\n")
+        return params
 
-                # cache each object for later processing
-                self.fk_objects.append(obj)
+    def is_incremental_model(self):
+        """Can the endpoint of the model be filtered by modified date?"""
+        return "modified_gmt" in [f.name for f in self.model._meta.fields]
 
-                # foreign keys
-                foreign_key_data = self.get_foreign_key_data(
-                    self.model.process_foreign_keys, self.model, item
-                )
+    def save_last_modified_gmt(self):
+        """Store the highest modified_gmt imported on the endpoint."""
+        if not self.endpoint or not self.last_modified_gmt:
+            return
 
-                obj.wp_foreign_keys = foreign_key_data
+        last_modified_gmt = parse_datetime(self.last_modified_gmt)
+        if settings.USE_TZ:
+            last_modified_gmt = timezone.make_aware(
+                last_modified_gmt, datetime.timezone.utc
+            )
 
-                # cache each object for later processing
-                self.mtm_objects.append(obj)
+        if (
+            not self.endpoint.last_modified_gmt
+            or last_modified_gmt > self.endpoint.last_modified_gmt
+        ):
+            self.endpoint.last_modified_gmt = last_modified_gmt
+            self.endpoint.save(update_fields=["last_modified_gmt"])
 
-                # Process many to many keys
-                many_to_many_data = self.get_many_to_many_data(
-                    self.model.process_many_to_many_keys, item
-                )
+    def import_data(self):
+        """Import data from wordpress api for each endpoint
 
-                obj.wp_many_to_many_keys = many_to_many_data
+        The progress is saved to the ImportCheckpoint of the model after each
+        batch of pages and each phase. If the import fails it's resumed from
+        the checkpoint when it's run again, unless restart is set.
+        """
 
-                # process clean fields (html)
-                self.process_clean_fields(
-                    self.model.process_clean_fields,
-                    self.model.clean_content_html,
-                    self.cleaned_objects,
-                    data,
-                    obj,
-                )
+        sys.stdout.write("Importing data...\n")
+
+        if STAGE_FETCH not in self.stages:
+            self.run_stages()
+            if self.sync:
+                self.sync_deletions()
+            return
+
+        self.checkpoint = self.get_checkpoint()
+        phase = ImportCheckpoint.PHASES.index(self.checkpoint.phase)
+
+        if self.start_page is None:
+            self.start_page = self.checkpoint.last_page + 1
+        else:
+            phase = 0  # resume the fetch phase from the page given
+        if self.start_page > 1 or phase > 0:
+            self.resumed = True
+            sys.stdout.write(
+                f"Resuming {self.model.__name__} from the {self.checkpoint.phase} phase\n"
+            )
+
+        if phase <= 0:
+            self.import_pages()
+            self.save_checkpoint(phase=ImportCheckpoint.PHASE_FOREIGN_KEYS)
+
+        pk_maps = {}
+        if phase <= 1 and STAGE_RELATIONS in self.stages:
+            self.process_foreign_keys(pk_maps)
+        self.save_checkpoint(phase=ImportCheckpoint.PHASE_MANY_TO_MANY)
+
+        if STAGE_RELATIONS in self.stages:
+            self.process_many_to_many_keys(pk_maps)
+            self.save_source_hashes()
+        if not self.build_content_on_fetch:
+            self.process_content()
+        self.save_checkpoint(phase=ImportCheckpoint.PHASE_COMPLETE)
+
+        # only move the high-water mark once everything has been imported
+        self.save_last_modified_gmt()
+
+        if self.sync:
+            self.sync_deletions()
+
+    def sync_deletions(self):
+        """Delete the records whose wp_id is no longer in the endpoint.
+
+        Only the ids of the endpoint are requested, the most per page, and
+        the records missing from them are deleted.
+        Nothing is deleted unless every id was fetched, i.e. as many as
+        X-WP-Total.
+
+        Returns the number of records deleted.
+        """
+        client = Client(
+            self.url,
+            params={
+                "per_page": getattr(settings, "WPI_PER_PAGE", 100),
+                "_fields": "id",
+            },
+        )
+        live_wp_ids = {item["id"] for item in client.iter_items()}
+        if len(live_wp_ids) != client.get_total_results:
+            sys.stdout.write(
+                f"Not syncing deleted {self.model.__name__}, fetched "
+                f"{len(live_wp_ids)} of {client.get_total_results} ids\n"
+            )
+            return 0
+
+        wp_ids = set(self.model.objects.values_list("wp_id", flat=True))
+        deleted_wp_ids = sorted(wp_ids - live_wp_ids)
+        if deleted_wp_ids:
+            # records of other endpoints that point at them are kept, their
+            # keys are SET_NULL, as they're synced by their own endpoint
+            self.model.objects.filter(wp_id__in=deleted_wp_ids).delete()
+
+        sys.stdout.write(
+            f"Deleted {len(deleted_wp_ids)} {self.model.__name__} "
+            f"no longer in WordPress\n"
+        )
+        return len(deleted_wp_ids)
 
-        # process foreign keys here so we have access to all possible
+    def run_stages(self):
+        """Run the stages other than fetch over every existing record."""
+        sys.stdout.write(
+            f"Running the {', '.join(self.stages)} stages of {self.model.__name__}\n"
+        )
+        if STAGE_RELATIONS in self.stages:
+            pk_maps = {}
+            self.process_foreign_keys(pk_maps)
+            self.process_many_to_many_keys(pk_maps)
+        self.process_content()
+
+    def process_foreign_keys(self, pk_maps):
+        # process foreign keys after the fetch so we have access to all possible
         # foreign keys if the foreign key is self referencing
         # for none self referencing foreign keys the order of imports matters
-        self.process_fk_objects(self.fk_objects)
-        self.process_mtm_objects(self.mtm_objects)
+        sys.stdout.write("Processing foreign keys...\n")
+        for fk_records in self.iter_deferred_records("wp_foreign_keys"):
+            self.process_fk_objects(
+                self.model, fk_records, pk_maps, self.unresolved_pks
+            )
 
-        # process wagtail blocks
-        self.process_wagtail_block_content(
-            self.model.process_block_fields(), self.cleaned_objects
+    def process_many_to_many_keys(self, pk_maps):
+        """Link the many to many keys of each chunk, reporting what's missing once."""
+        sys.stdout.write("Processing many to many keys...\n")
+        unresolved = {}
+        for mtm_records in self.iter_deferred_records("wp_many_to_many_keys"):
+            self.process_mtm_objects(
+                self.model, mtm_records, pk_maps, unresolved, self.unresolved_pks
+            )
+        self.report_unresolved(unresolved)
+
+    def save_source_hashes(self):
+        """Save the source hashes held back until the relations were resolved.
+
+        Records whose relations couldn't all be resolved are left without a
+        hash so they're imported again, e.g. once the tags of a post exist.
+        """
+        batch_size = getattr(settings, "WPI_BULK_BATCH_SIZE", 500)
+        wp_ids = list(self.pending_source_hashes)
+        for start in range(0, len(wp_ids), batch_size):
+            end = start + batch_size
+            pks = self.model.objects.filter(wp_id__in=wp_ids[start:end])
+            objects = [
+                self.model(pk=pk, wp_source_hash=self.pending_source_hashes[wp_id])
+                for wp_id, pk in pks.values_list("wp_id", "pk")
+                if pk not in self.unresolved_pks
+            ]
+            self.model.objects.bulk_update(objects, ["wp_source_hash"])
+        self.pending_source_hashes = {}
+
+    def get_checkpoint_url(self):
+        """Return the url of the first page with the params of every page.
+
+        The page numbers of a checkpoint are only valid for the same url
+        and params, e.g. per_page, _fields and modified_after.
+        """
+        params = getattr(self.client, "params", None)
+        if not params:
+            return self.client.url
+        return f"{self.client.url}?{urlencode(sorted(params.items()))}"
+
+    def get_checkpoint(self):
+        """Return the checkpoint to resume from, or a new one to start from."""
+        url = self.get_checkpoint_url()
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(
+            model=self.model.__name__, defaults={"url": url}
+        )
+        if (
+            self.restart
+            or checkpoint.phase == ImportCheckpoint.PHASE_COMPLETE
+            or checkpoint.url != url
+        ):
+            checkpoint.url = url
+            checkpoint.last_page = 0
+            checkpoint.phase = ImportCheckpoint.PHASE_FETCH
+            checkpoint.save()
+        return checkpoint
+
+    def save_checkpoint(self, **kwargs):
+        for field, value in kwargs.items():
+            setattr(self.checkpoint, field, value)
+        self.checkpoint.save(update_fields=[*kwargs, "updated"])
+
+    def import_pages(self):
+        """Import each page of the endpoint.
+
+        Each batch of pages is imported in one transaction. If a batch fails
+        only that batch is rolled back, the import can be resumed from the
+        page after the last committed page.
+        """
+        self.unique_keys = self.get_unique_keys()
+        self.created = self.updated = self.skipped = 0
+        self.last_committed_page = self.start_page - 1
+
+        self.stream_block_signatures = None
+        if self.build_content_on_fetch and self.model.process_clean_fields():
+            self.stream_block_signatures = (
+                WagtailBlockBuilder.load_stream_block_signatures()
+            )
+            # rebuild the blocks of every record when the signatures change
+            self.hash_salt = json.dumps(self.stream_block_signatures)
+            self.executor = self.get_executor(self.stream_block_signatures)
+
+        urls = None
+        if self.start_page > 1:
+            sys.stdout.write(f"Resuming from page {self.start_page}\n")
+            urls = islice(self.client.iter_paged_endpoints(), self.start_page - 1, None)
+
+        # the client fetches the next pages in the background
+        # while the items of the current page are being imported
+        pages = enumerate(self.client.fetch_pages(urls), start=self.start_page)
+        try:
+            while True:
+                batch = list(islice(pages, self.batch_size))
+                if not batch:
+                    break
+                with transaction.atomic():
+                    for _, (endpoint, json_response) in batch:
+                        self.import_page(endpoint, json_response)
+                    # committed with the batch
+                    self.save_checkpoint(last_page=batch[-1][0])
+                self.last_committed_page = batch[-1][0]
+        except Exception:
+            # the unique keys of the rolled back batch are in the set
+            self.unique_keys = None
+            sys.stdout.write(
+                f"Import of {self.model.__name__} failed, "
+                f"the last committed page is {self.last_committed_page}. "
+                f"Run it again to resume from page {self.last_committed_page + 1}.\n"
+            )
+            raise
+        finally:
+            if self.executor:
+                self.executor.shutdown(cancel_futures=True)
+                self.executor = None
+
+        sys.stdout.write(
+            f"Created {self.created}, updated {self.updated}, "
+            f"skipped {self.skipped} unchanged {self.model.__name__} in total\n"
         )
 
-    @staticmethod
-    def get_many_to_many_data(process_many_to_many_keys, item):
-        many_to_many_data = []
-
-        for field in process_many_to_many_keys():
-            # each field to process
-            for key, value in field.items():
-                if item[key]:  # some are empty lists so ignore them
-                    """
-                    TRANSFORM: [key] = {[value] = {model: "WPCategory", field: "wp_id"}}
-                    OUTPUT:    [{"categories": {"model": "WPCategory", "where": "wp_id", "value": 38}}]
-                    """
-
-                    # assuming all many to many keys are to other models
-                    model = apps.get_model("wordpress", value["model"])
-
-                    # values = item.data[key]
-                    many_to_many_data.append(
-                        {
-                            key: {
-                                "model": model.__name__,
-                                "where": value["field"],
-                                "value": item[key],
-                            },
-                        }
-                    )
+    def import_page(self, endpoint, json_response):
+        """Import the items of a page and write them at once.
+
+        A record's source hash is only saved once it's fully imported. The
+        hashes of records with relations are held back until save_source_hashes.
+        """
+        sys.stdout.write(f"Importing {self.model.__name__} {endpoint}...\n")
+
+        count = skipped = 0
+        objects = []
+        for items in self.iter_item_chunks(json_response):
+            count += len(items)
+            source_hashes = {} if self.force else self.get_source_hashes(items)
+            staged_items = []
+            for item in items:
+                source_hash = self.get_source_hash(item)
+                if source_hashes.get(item["id"]) == source_hash:
+                    self.track_last_modified_gmt(item)
+                    skipped += 1
+                    continue
+
+                if self.stage:
+                    # a copy as import_item renames the id
+                    staged_items.append(dict(item))
+
+                obj = self.import_item(item)
+                if obj is None:
+                    continue
+                objects.append(obj)
+                if not self.save_source_hash:
+                    continue  # imported again by an import that runs every stage
+                if obj.wp_foreign_keys or obj.wp_many_to_many_keys:
+                    self.pending_source_hashes[obj.wp_id] = source_hash
+                else:
+                    obj.wp_source_hash = source_hash
+            stage_items(self.model.__name__, staged_items)
+
+        if self.executor:
+            source_fields = self.get_content_source_fields()
+            results = self.executor.map(
+                build_content,
+                repeat(self.model.__name__),
+                [{f: getattr(obj, f) for f in source_fields} for obj in objects],
+                chunksize=len(objects) // self.processes + 1,
+            )
+            for obj, content_fields in zip(objects, results):
+                self.set_content_fields(obj, content_fields)
+
+        created, updated, wp_ids = self.save_objects(objects)
+        sys.stdout.write(
+            f"Created {created}, updated {updated}, "
+            f"skipped {skipped} unchanged {self.model.__name__}\n"
+        )
+        self.created += created
+        self.updated += updated
+        self.skipped += skipped
 
-        return many_to_many_data
+        # keep track of each object for later processing
+        self.imported_wp_ids += wp_ids
+
+        metrics.record_items(self.client.url, count)
 
     @staticmethod
-    def get_foreign_key_data(process_foreign_keys, current_model, item):
-        foreign_key_data = []
-
-        for field in process_foreign_keys():
-            # get each field to process
-            for key, value in field.items():
-                if item[key]:  # some are just 0 so ignore them
-                    """e.g.
-                    INPUT:     "parent": {"model": "self", "field": "wp_id"},
-                    TRANSFORM: [key] = {[value] = {model: "self", field: "wp_id"}}
-                    OUTPUT:    {"parent": {"model": "WPCategory", "where": "wp_id", "value": 38}}
-                    """
-                    # self = a foreign key to the current model
-                    # or it's a foreign key to another model
-                    model = (
-                        current_model
-                        if value["model"] == "self"
-                        else apps.get_model("wordpress", value["model"])
-                    )
+    def iter_item_chunks(json_response):
+        """Yield the items of a page in lists.
+
+        A parsed page is one list. A streamed page is read a few items at a
+        time, WPI_STREAM_CHUNK_SIZE, so the raw items aren't all held at once.
+        """
+        if isinstance(json_response, list):
+            yield json_response
+            return
+        items = iter(json_response)
+        chunk_size = getattr(settings, "WPI_STREAM_CHUNK_SIZE", 20)
+        yield from iter(lambda: list(islice(items, chunk_size)), [])
+
+    def get_source_hash(self, item):
+        """Return a hash of the item's json as it came from the source."""
+        source = json.dumps(item, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(f"{self.hash_salt}{source}".encode("utf-8")).hexdigest()
+
+    def get_source_hashes(self, items):
+        """Return a {wp_id: wp_source_hash} dict of the items that exist."""
+        return dict(
+            self.model.objects.filter(
+                wp_id__in=[item["id"] for item in items]
+            ).values_list("wp_id", "wp_source_hash")
+        )
 
-                    foreign_key_data.append(
-                        {
-                            key: {
-                                "model": model.__name__,
-                                "where": value["field"],
-                                "value": item[key],
-                            },
-                        }
+    def import_item(self, item):
+        """Build an unsaved object from a single item of the json response.
+
+        Returns None if the item is skipped. The objects of a page are
+        saved together by save_objects.
+        """
+
+        # Some wordpress records have duplicate, essentially unique fields
+        # e.g. Tags has name and slug field but names can be the same
+        # That doesn't work well with taggit default model, but why would you have 2 the same anyway?
+        if hasattr(self.model, "UNIQUE_FIELDS"):
+            if self.unique_keys is None:
+                self.unique_keys = self.get_unique_keys()
+            unique_key = tuple(item[field] for field in self.model.UNIQUE_FIELDS)
+            if unique_key in self.unique_keys:
+                return None  # bail out of this item,
+                # TODO: the side effect is the object won't be updated only created
+            self.unique_keys.add(unique_key)
+
+        self.track_last_modified_gmt(item)
+
+        # rename the id field to wp_id
+        item["wp_id"] = item.pop("id")
+        data = {
+            field: item[field] for field in self.plan.import_fields if field in item
+        }
+
+        # some data is nested in the json response
+        # so use jmespath to get to it and update the value
+        for key, expression in self.plan.process_fields:
+            data[key] = expression.search(item)
+
+        # the object with the data we have so far
+        obj = self.model(**data)
+        self.update_fields.update(dict.fromkeys(data))
+
+        # foreign keys
+        foreign_key_data = self.get_foreign_key_data(self.plan.foreign_keys, item)
+
+        obj.wp_foreign_keys = foreign_key_data
+
+        # Process many to many keys
+        many_to_many_data = self.get_many_to_many_data(
+            self.plan.many_to_many_keys, item
+        )
+
+        obj.wp_many_to_many_keys = many_to_many_data
+
+        # process clean fields (html) and wagtail blocks,
+        # in parallel mode import_page builds them for the whole page
+        if self.build_content_on_fetch and not self.executor:
+            self.set_content_fields(
+                obj,
+                build_content(self.model.__name__, data, self.stream_block_signatures),
+            )
+
+        return obj
+
+    def track_last_modified_gmt(self, item):
+        """Keep track of the most recent modification for incremental imports."""
+        # the values are all ISO 8601 in GMT so they compare as strings
+        modified_gmt = item.get("modified_gmt")
+        if modified_gmt and (
+            not self.last_modified_gmt or modified_gmt > self.last_modified_gmt
+        ):
+            self.last_modified_gmt = modified_gmt
+
+    def get_content_operations(self, stages=None):
+        """Return the {source_field: destination_field} of build_content's stages."""
+        stages = stages or [STAGE_CLEAN, STAGE_BLOCKS]
+        operations = []
+        if STAGE_CLEAN in stages:
+            operations += self.model.process_clean_fields()
+        if STAGE_BLOCKS in stages:
+            operations += self.model.process_block_fields()
+        return operations
+
+    def get_content_source_fields(self, stages=None):
+        """Return the fields build_content needs for the stages."""
+        operations = self.get_content_operations(stages)
+        destination_fields = self.get_content_destination_fields(stages)
+        return list(
+            dict.fromkeys(
+                source_field
+                for operation in operations
+                for source_field in operation
+                if source_field not in destination_fields
+            )
+        )
+
+    def get_content_destination_fields(self, stages=None):
+        """Return the fields build_content writes for the stages."""
+        return [
+            destination_field
+            for operation in self.get_content_operations(stages)
+            for destination_field in operation.values()
+        ]
+
+    def get_executor(self, stream_block_signatures=None):
+        """Return a pool of processes to build the content with, if there's more than one."""
+        if self.processes > 1:
+            # the workers are given the signatures once so they don't use the database,
+            # they're spawned as forking import_all's threads could deadlock
+            return ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=content_worker.init_content_worker,
+                initargs=(stream_block_signatures,),
+            )
+        return None
+
+    def process_content(self):
+        """Clean the content and/or build the blocks of the existing records.
+
+        Only the clean and blocks stages that are run are processed. The
+        records are read back in chunks, their content built and written
+        with one bulk update per chunk. If the import fetched the records
+        only those are processed, otherwise every record of the model.
+        """
+        stages = [
+            stage for stage in [STAGE_CLEAN, STAGE_BLOCKS] if stage in self.stages
+        ]
+        if not stages or not self.model.process_clean_fields():
+            return
+
+        sys.stdout.write(
+            f"Processing the {' and '.join(stages)} content of {self.model.__name__}...\n"
+        )
+        source_fields = self.get_content_source_fields(stages)
+        destination_fields = self.get_content_destination_fields(stages)
+
+        stream_block_signatures = None
+        if STAGE_BLOCKS in stages:
+            stream_block_signatures = WagtailBlockBuilder.load_stream_block_signatures()
+
+        processed = 0
+        executor = self.get_executor(stream_block_signatures)
+        try:
+            for chunk in self.iter_content_records(source_fields):
+                items = [dict(zip(source_fields, row[1:])) for row in chunk]
+                if executor:
+                    # the workers already have the signatures
+                    results = executor.map(
+                        build_content,
+                        repeat(self.model.__name__),
+                        items,
+                        repeat(None),
+                        repeat(stages),
+                        chunksize=len(items) // self.processes + 1,
                     )
+                else:
+                    results = map(
+                        build_content,
+                        repeat(self.model.__name__),
+                        items,
+                        repeat(stream_block_signatures),
+                        repeat(stages),
+                    )
+                objects = [
+                    self.model(pk=row[0], **content_fields)
+                    for row, content_fields in zip(chunk, results)
+                ]
+                if objects:
+                    self.model.objects.bulk_update(objects, destination_fields)
+                processed += len(objects)
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+
+        sys.stdout.write(
+            f"Processed the content of {processed} {self.model.__name__}\n"
+        )
+
+    def iter_content_records(self, source_fields):
+        """Yield chunks of (pk, *source_fields) for process_content."""
+        batch_size = getattr(settings, "WPI_BULK_BATCH_SIZE", 500)
+        queryset = self.model.objects.order_by("pk").values_list("pk", *source_fields)
+
+        if STAGE_FETCH in self.stages and not self.resumed:
+            for start in range(0, len(self.imported_wp_ids), batch_size):
+                end = start + batch_size
+                wp_ids = self.imported_wp_ids[start:end]
+                yield list(queryset.filter(wp_id__in=wp_ids))
+            return
+
+        rows = queryset.iterator(chunk_size=batch_size)
+        yield from iter(lambda: list(islice(rows, batch_size)), [])
+
+    def set_content_fields(self, obj, content_fields):
+        for field, value in content_fields.items():
+            setattr(obj, field, value)
+        self.update_fields.update(dict.fromkeys(content_fields))
+
+    def get_unique_keys(self):
+        """Return a set of the UNIQUE_FIELDS values of the existing records.
+
+        It's loaded once per import and import_item adds the new keys to it,
+        so finding duplicates doesn't need a query per item.
+        """
+        if not hasattr(self.model, "UNIQUE_FIELDS"):
+            return None
+        return set(self.model.objects.values_list(*self.model.UNIQUE_FIELDS))
+
+    def save_objects(self, objects):
+        """Create or update the objects in one statement.
+
+        Returns the number of objects created and updated, and their wp_ids.
+        """
+        if not objects:
+            return 0, 0, []
+
+        # an upsert can't change the same row twice, keep the last of each wp_id
+        objects = list({obj.wp_id: obj for obj in objects}.values())
+        wp_ids = [obj.wp_id for obj in objects]
+        existing_count = self.model.objects.filter(wp_id__in=wp_ids).count()
+
+        update_fields = [field for field in self.update_fields if field != "wp_id"]
+        bulk_upsert(self.model, objects, ["wp_id"], update_fields)
+
+        return len(wp_ids) - existing_count, existing_count, wp_ids
+
+    def iter_deferred_records(self, field):
+        """Yield chunks of (pk, field) for the imported objects.
+
+        The chunks are read from the database so the deferred passes don't
+        need the imported objects, and their content, in memory. When the
+        import was resumed every record of the model is read, as the pages
+        committed before it failed still need their relations, and so are
+        they when the fetch stage isn't run.
+        """
+        batch_size = getattr(settings, "WPI_BULK_BATCH_SIZE", 500)
+        queryset = self.model.objects.exclude(**{f"{field}__isnull": True})
+
+        if self.resumed or STAGE_FETCH not in self.stages:
+            # the pages committed before resuming still need their relations
+            pks = list(queryset.order_by("pk").values_list("pk", flat=True))
+            for start in range(0, len(pks), batch_size):
+                end = start + batch_size
+                yield list(
+                    queryset.filter(pk__in=pks[start:end]).values_list("pk", field)
+                )
+            return
 
-        return foreign_key_data
+        for start in range(0, len(self.imported_wp_ids), batch_size):
+            end = start + batch_size
+            wp_ids = self.imported_wp_ids[start:end]
+            yield list(queryset.filter(wp_id__in=wp_ids).values_list("pk", field))
 
     @staticmethod
-    def process_clean_fields(
-        clean_fields, clean_content_html, cleaned_objects, data, obj
-    ):
-        for cleaned_field in clean_fields():
-            for source_field, destination_field in cleaned_field.items():
-                setattr(
-                    obj,
-                    destination_field,
-                    clean_content_html(data[source_field]),
-                )
+    def get_many_to_many_data(many_to_many_keys, item):
+        """
+        INPUT:  [("categories", "WPCategory", "wp_id")], see ExtractionPlan
+        OUTPUT: [{"categories": {"model": "WPCategory", "where": "wp_id", "value": [38]}}]
+        """
+        return [
+            {key: {"model": model_name, "where": where, "value": item[key]}}
+            for key, model_name, where in many_to_many_keys
+            if item[key]  # some are empty lists so ignore them
+        ]
 
-            cleaned_objects.append(obj)
-            obj.save()
+    @staticmethod
+    def get_foreign_key_data(foreign_keys, item):
+        """
+        INPUT:  [("parent", "WPCategory", "wp_id")], see ExtractionPlan
+        OUTPUT: [{"parent": {"model": "WPCategory", "where": "wp_id", "value": 38}}]
+        """
+        return [
+            {key: {"model": model_name, "where": where, "value": item[key]}}
+            for key, model_name, where in foreign_keys
+            if item[key]  # some are just 0 so ignore them
+        ]
 
     @staticmethod
-    def process_fk_objects(fk_objects):
-        sys.stdout.write("Processing foreign keys...\n")
-        for obj in fk_objects:
-            for relation in obj.wp_foreign_keys:
+    def get_pk_map(pk_maps, model_name, where):
+        """Return a {where: pk} map of the model, loading it into pk_maps once."""
+        if (model_name, where) not in pk_maps:
+            model = apps.get_model("wordpress", model_name)
+            pk_maps[model_name, where] = dict(model.objects.values_list(where, "pk"))
+        return pk_maps[model_name, where]
+
+    @staticmethod
+    def process_fk_objects(model, fk_records, pk_maps=None, unresolved_pks=None):
+        """Resolve the wp_foreign_keys of (pk, wp_foreign_keys) records.
+
+        One {where: pk} map is loaded per related model, e.g. wp_id -> pk,
+        so self referencing keys are resolved in the same pass. Pass the
+        same pk_maps to each call to only load them once.
+
+        The pks of records with a key that can't be found are added to
+        unresolved_pks if it's passed.
+        """
+        pk_maps = {} if pk_maps is None else pk_maps
+        updated_objects = []
+        update_fields = set()
+
+        for obj_pk, foreign_keys in fk_records:
+            obj = model(pk=obj_pk)
+            updated = False
+            for relation in foreign_keys or []:
                 for field, value in relation.items():
-                    try:
-                        model = apps.get_model("wordpress", value["model"])
-                        where = value["where"]
-                        value = value["value"]
-                        setattr(obj, field, model.objects.get(**{where: value}))
-                    except model.DoesNotExist:
+                    model_name, where = value["model"], value["where"]
+                    value = value["value"]
+                    pk = Importer.get_pk_map(pk_maps, model_name, where).get(value)
+                    if pk is None:
                         sys.stdout.write(
-                            f"""Could not find {model.__name__} with {where}={value}. {obj} with id={obj.id}\n"""
+                            f"Could not find {model_name} with {where}={value}. "
+                            f"{model.__name__} with id={obj_pk}\n"
                         )
-                obj.save()
+                        if unresolved_pks is not None:
+                            unresolved_pks.add(obj_pk)
+                        continue
+
+                    setattr(obj, model._meta.get_field(field).attname, pk)
+                    update_fields.add(field)
+                    updated = True
+
+            if updated:
+                updated_objects.append(obj)
+
+        # only write the foreign keys, the rest was saved by the upsert
+        if updated_objects:
+            model.objects.bulk_update(
+                updated_objects,
+                sorted(update_fields),
+                batch_size=getattr(settings, "WPI_BULK_BATCH_SIZE", 500),
+            )
 
     @staticmethod
-    def process_mtm_objects(mtm_objects):
-        sys.stdout.write("Processing many to many keys...\n")
-        for obj in mtm_objects:
-            for relation in obj.wp_many_to_many_keys:
-                related_objects = []
+    def process_mtm_objects(
+        model, mtm_records, pk_maps=None, unresolved=None, unresolved_pks=None
+    ):
+        """Link the wp_many_to_many_keys of (pk, wp_many_to_many_keys) records.
+
+        The rows of each auto-created through table are built for every
+        record and inserted together, existing links are left as they are.
+
+        The related values that can't be found are reported, unless an
+        unresolved dict is passed to collect them in for report_unresolved,
+        and the pks of their records are added to unresolved_pks if it's passed.
+        """
+        pk_maps = {} if pk_maps is None else pk_maps
+        through_rows = {}
+        report = unresolved is None
+        unresolved = {} if unresolved is None else unresolved
+
+        for obj_pk, many_to_many_keys in mtm_records:
+            for relation in many_to_many_keys or []:
                 for field, value in relation.items():
-                    model = apps.get_model("wordpress", value["model"])
-                    filter = f"""{value["where"]}__in"""
-                    related_objects = model.objects.filter(**{filter: value["value"]})
-                    if len(related_objects) != len(value["value"]):
-                        sys.stdout.write(
-                            f"""Some {model.__name__} objects could not be found. {obj} with id={obj.id}\n"""
+                    model_name, where = value["model"], value["where"]
+                    pk_map = Importer.get_pk_map(pk_maps, model_name, where)
+
+                    m2m_field = model._meta.get_field(field)
+                    through = m2m_field.remote_field.through
+                    rows = through_rows.setdefault(through, [])
+                    for related_value in value["value"]:
+                        pk = pk_map.get(related_value)
+                        if pk is None:
+                            unresolved.setdefault(model_name, set()).add(related_value)
+                            if unresolved_pks is not None:
+                                unresolved_pks.add(obj_pk)
+                            continue
+                        rows.append(
+                            through(
+                                **{
+                                    m2m_field.m2m_column_name(): obj_pk,
+                                    m2m_field.m2m_reverse_name(): pk,
+                                }
+                            )
                         )
 
-                for related_object in related_objects:
-                    getattr(obj, field).add(related_object)
+        for through, rows in through_rows.items():
+            through.objects.bulk_create(
+                rows,
+                ignore_conflicts=True,
+                batch_size=getattr(settings, "WPI_BULK_BATCH_SIZE", 500),
+            )
+
+        if report:
+            Importer.report_unresolved(unresolved)
 
     @staticmethod
-    def process_wagtail_block_content(block_fields, cleaned_objects):
-        sys.stdout.write("Processing Wagtail block content...\n")
-
-        for obj in cleaned_objects:
-            # get the configured fields to process
-            for operation in block_fields:
-                fields = ()
-                for k, v in operation.items():
-                    fields = (k, v)
-
-                source_data = getattr(obj, fields[0])
-                block_data = WagtailBlockBuilder().build(source_data)
-                # print(block_data)
-                setattr(obj, fields[1], block_data)
-                obj.save()
+    def report_unresolved(unresolved):
+        """Write the {model_name: values} that couldn't be found."""
+        for model_name, values in unresolved.items():
+            sys.stdout.write(
+                f"Could not find {len(values)} {model_name} objects: {sorted(values)}\n"
+            )